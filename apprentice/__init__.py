@@ -8,6 +8,7 @@ from apprentice.weights import read_pointmatchers
 from apprentice.scaler import Scaler
 from apprentice.monomial import monomialStructure
 from apprentice.appset import AppSet
+from apprentice.orderscan import OrderScan
 try:
     from apprentice.GP import GaussianProcess
 except ImportError as e:
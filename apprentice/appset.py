@@ -27,44 +27,86 @@ def calcHistoCov(h, COV_P, result):
     return COV_H
 
 
-from numba import jit, njit
-@jit(parallel=True, forceobj=True)
-def startPoints(self, _PP):
-    _CH = np.empty(len(_PP))
-    for p in range(len(_PP)):
-       _CH[p] = self.objective(_PP[p])
-    return _PP[np.argmin(_CH)]
-
-@jit(forceobj=True)#, parallel=True)
-def prime(GREC, COEFF, dim, NNZ):
-    ret = np.empty((len(COEFF), dim))
-    for i in range(dim):
-        ret[:,i] = np.sum(COEFF[:,NNZ[i]] * GREC[i, NNZ[i]], axis=2).flatten()
-    return ret
+from numba import njit, prange
+from apprentice.monomial import powerTable
 
-@jit(forceobj=True)#, parallel=True)
-def doubleprime(dim, xs, NSEL, HH, HNONZ, EE, COEFF):
-    ret = np.empty((dim, dim, NSEL), dtype=np.float64)
-    for numx in range(dim):
-        for numy in range(dim):
-            rec = HH[numx][numy][HNONZ[numx][numy]] * np.prod(np.power(xs, EE[numx][numy][HNONZ[numx][numy]]), axis=1)
-            if numy>=numx:
-                ret[numx][numy] = np.sum((rec*COEFF[:,HNONZ[numx][numy][0]]), axis=1)
-            else:
-                ret[numx][numy] = ret[numy][numx]
+@njit
+def gradientRecurrence(xs, S, jacfac):
+    """
+    Derivatives of the monomials in structure S at the scaled point xs,
+    shape (dim, len(S)), including the jacobian factors.
+    """
+    nc, dim = S.shape
+    PT = powerTable(xs, S.max())
+    GREC = np.zeros((dim, nc))
+    for j in range(nc):
+        for c in range(dim):
+            if S[j, c] == 0: continue
+            term = jacfac[c] * S[j, c]
+            for i in range(dim):
+                term *= PT[i, S[j, i] - 1] if i == c else PT[i, S[j, i]]
+            GREC[c, j] = term
+    return GREC
+
+@njit
+def hessianRecurrence(xs, S, jacfac):
+    """
+    Second derivatives of the monomials in structure S at the scaled point xs,
+    shape (dim, dim, len(S)), including the jacobian factors.
+    """
+    nc, dim = S.shape
+    PT = powerTable(xs, S.max())
+    HREC = np.zeros((dim, dim, nc))
+    for j in range(nc):
+        for cx in range(dim):
+            for cy in range(cx, dim):
+                if cx == cy: pf = S[j, cx] * (S[j, cx] - 1)
+                else:        pf = S[j, cx] *  S[j, cy]
+                if pf == 0: continue
+                term = pf * jacfac[cx] * jacfac[cy]
+                for i in range(dim):
+                    e = S[j, i]
+                    if i == cx: e -= 1
+                    if i == cy: e -= 1
+                    term *= PT[i, e]
+                HREC[cx, cy, j] = term
+                HREC[cy, cx, j] = term
+    return HREC
 
+@njit(parallel=True)
+def prime(GREC, COEFF):
+    """
+    First derivatives of all polynomials with coefficients COEFF (one row per bin),
+    shape (nbins, dim).
+    """
+    nbins, nc = COEFF.shape
+    dim = GREC.shape[0]
+    ret = np.empty((nbins, dim))
+    for b in prange(nbins):
+        for i in range(dim):
+            temp = 0.
+            for k in range(nc): temp += COEFF[b, k] * GREC[i, k]
+            ret[b, i] = temp
     return ret
 
-@jit
-def jitprime(GREC, COEFF, dim):
-    ret = np.empty((len(COEFF), dim))
-    for i in range(dim):
-        for j in range(len(COEFF)):
-            ret[j,i] = np.sum(COEFF[j] * GREC[i])
+@njit(parallel=True)
+def doubleprime(HREC, COEFF):
+    """
+    Second derivatives of all polynomials with coefficients COEFF (one row per bin),
+    shape (dim, dim, nbins).
+    """
+    nbins, nc = COEFF.shape
+    dim = HREC.shape[0]
+    ret = np.empty((dim, dim, nbins))
+    for b in prange(nbins):
+        for numx in range(dim):
+            for numy in range(numx, dim):
+                temp = 0.
+                for k in range(nc): temp += COEFF[b, k] * HREC[numx, numy, k]
+                ret[numx, numy, b] = temp
+                ret[numy, numx, b] = temp
     return ret
 
-
-
 @njit(parallel=True)
 def calcSpans(spans1, DIM, G1, G2, H2, H3, grads, egrads):
     for numx in range(DIM):
@@ -80,6 +122,33 @@ def calcSpans(spans1, DIM, G1, G2, H2, H3, grads, egrads):
     return spans1
 
 
+class AppBlock(object):
+    """
+    Bins of an AppSet sharing the same orders and type. The coefficients are
+    stored as dense matrices of exactly the required width, one row per bin.
+    Since monomialStructure is graded-lex, the first ncp (ncq) entries of the
+    maximum order recurrence are the numerator (denominator) recurrence.
+    """
+    def __init__(self, idx, m, n, PC, QC=None):
+        self.idx = np.array(idx, dtype=np.int64)  # Positions of the bins in the AppSet
+        self.m   = m
+        self.n   = n
+        self.PC  = PC
+        self.QC  = QC
+
+    @property
+    def isRational(self): return self.QC is not None
+    @property
+    def ncp(self): return self.PC.shape[1]
+    @property
+    def ncq(self): return self.QC.shape[1] if self.isRational else 0
+
+    def __len__(self): return len(self.idx)
+
+    def __repr__(self):
+        return "<AppBlock bins:{} m:{} n:{} rational:{}>".format(len(self), self.m, self.n, self.isRational)
+
+
 class AppSet(object):
     """
     Collection of Apprentice approximations with the same support.
@@ -87,168 +156,361 @@ class AppSet(object):
     def __init__(self, *args, **kwargs):
         self._debug = kwargs["debug"] if kwargs.get("debug") is not None else False
         if type(args[0]) == str:
-            self.mkFromFile(*args, **kwargs)
+            import h5py
+            if h5py.is_hdf5(args[0]): self.mkFromH5(*args, **kwargs)
+            else:                     self.mkFromFile(*args, **kwargs)
+        elif isinstance(args[0], AppSet):
+            self.mkFromAppSet(*args, **kwargs)
         else:
             self.mkFromData(*args, **kwargs)
 
     @property
     def dim(self): return self._dim
 
-    def mkFromFile(self, f_approx, binids=None, **kwargs):
-        binids, RA = apprentice.io.readApprox(f_approx, set_structures=False, usethese=binids)
-        self._binids=np.array(binids)
+    def mkFromFile(self, f_approx, binids=None, observables=None, **kwargs):
+        self.mkFromBlocks(*apprentice.io.readApproxJSON(f_approx, usethese=binids, observables=observables), **kwargs)
+
+    def mkFromData(self, RA, binids, **kwargs):
         self._RA = np.array(RA)
+        self._binids = np.array(binids)
+        self._SCLR = self._RA[0]._scaler  # Here we quietly assume already that all scalers are identical
+        self._samescaler = np.array([r._scaler is self._SCLR or r._scaler == self._SCLR for r in self._RA])
+        self._m = np.array([r.m                             for r in self._RA], dtype=np.int64)
+        self._n = np.array([r.n if hasattr(r, "n") else 0 for r in self._RA], dtype=np.int64)
+        for name in ["vmin", "vmax", "xmin", "xmax"]:
+            V = [getattr(r, name, None) for r in self._RA]
+            setattr(self, "_"+name, np.array([v if v is not None else np.nan for v in V], dtype=np.float64))
+        self.setCoefficients()
         self.setAttributes(**kwargs)
 
-    def mkFromData(self, RA, binids, **kwargs):
-        self._RA = RA
-        self._binids = binids
+    def mkFromH5(self, f_approx, binids=None, observables=None, **kwargs):
+        """
+        Load from a container written by apprentice.io.writeApproxH5 ---
+        the coefficient blocks are memory mapped, no per bin objects are created.
+        """
+        self.mkFromBlocks(*apprentice.io.readApproxH5(f_approx, usethese=binids, observables=observables), **kwargs)
+
+    def mkFromBlocks(self, binids, SCLR, info, blocks, **kwargs):
+        """
+        Set up from per bin arrays info and coefficient blocks
+        (idx, m, n, PC, QC) as returned by the readers in apprentice.io.
+        """
+        self._RA = None
+        self._binids = np.array(binids)
+        self._SCLR = SCLR
+        self._samescaler = np.ones(len(binids), dtype=bool)
+        for name, V in info.items(): setattr(self, "_"+name, V)
+        self.setBlocks([AppBlock(*b) for b in blocks])
+        self.setAttributes(**kwargs)
+
+    def mkFromAppSet(self, AS, keep, **kwargs):
+        """
+        The subset keep of the bins of AS, sharing its scaler.
+        """
+        keep = np.arange(len(AS))[keep]
+        newpos = np.full(len(AS), -1, dtype=np.int64)
+        newpos[keep] = np.arange(len(keep))
+        self._RA = AS._RA[keep] if AS._RA is not None else None
+        self._binids = AS._binids[keep]
+        self._SCLR = AS._SCLR
+        for name in ["m", "n", "vmin", "vmax", "xmin", "xmax", "samescaler"]:
+            setattr(self, "_"+name, getattr(AS, "_"+name)[keep])
+        blocks = []
+        for B in AS._blocks:
+            rows = np.where(newpos[B.idx] >= 0)[0]
+            if len(rows) == 0: continue
+            blocks.append(AppBlock(newpos[B.idx[rows]], B.m, B.n, B.PC[rows], B.QC[rows] if B.isRational else None))
+        self.setBlocks(blocks)
         self.setAttributes(**kwargs)
 
     def mkReduced(self, keep, **kwargs):
-        return AppSet(np.array(self._RA)[keep], np.array(self._binids)[keep], **kwargs)
+        return AppSet(self, keep, **kwargs)
 
     def setAttributes(self, **kwargs):
         self._hnames = sorted(list(set([b.split("#")[0] for b in self._binids])))
-        self._dim = self._RA[0].dim
-        self._SCLR = self._RA[0]._scaler  # Here we quietly assume already that all scalers are identical
+        self._dim = self._SCLR.dim
         self._bounds = self._SCLR.box
         self._debug = kwargs["debug"] if kwargs.get("debug") is not None else False
-        if self.dim == 1: self.recurrence = apprentice.monomial.recurrence1D
-        else:             self.recurrence = apprentice.monomial.recurrence
         self.setStructures()
-        self.setCoefficients()
 
     def setStructures(self):
-        omax_p=np.max([r.m                            for r in self._RA])
-        omax_q=np.max([r.n if hasattr(r, "n") else 0  for r in self._RA])
-        omax = max(omax_p, omax_q)
-
+        omax = max([max(B.m, B.n) for B in self._blocks])
         self._structure = np.array(apprentice.monomialStructure(self.dim, omax), dtype=np.int32)
-        S=self._structure
-        # Gradient helpers
-        self._NNZ  = [np.where(self._structure[:, coord] != 0) for coord in range(self.dim)]
-        self._sred = np.array([self._structure[nz][:,num] for num, nz in enumerate(self._NNZ)], dtype=np.int32)
-        # Hessian helpers
-        self._HH = np.ones((self.dim, self.dim, len(S))             , dtype=np.float64) # Prefactors
-        self._EE = np.full((self.dim, self.dim, len(S), self.dim), S, dtype=np.int32) # Initial structures
-
-        for numx in range(self.dim):
-            for numy in range(self.dim):
-                if numx==numy:
-                    self._HH[numx][numy] = S[:,numx] * (S[:,numx]-1)
-                else:
-                    self._HH[numx][numy] = S[:,numx] *  S[:,numy]
-                self._EE[numx][numy][:,numx]-=1
-                self._EE[numx][numy][:,numy]-=1
-
-        self._HNONZ = np.empty((self.dim, self.dim), dtype=tuple)
-        for numx in range(self.dim):
-            for numy in range(self.dim):
-                self._HNONZ[numx][numy]=np.where(self._HH[numx][numy]>0)
-
-        # Jacobians for Hessian
-        JF = self._SCLR.jacfac
-        for numx in range(self.dim):
-            for numy in range(self.dim):
-                self._HH[numx][numy][self._HNONZ[numx][numy]] *= (JF[numx] * JF[numy])
+        self._S2D = self._structure.reshape((len(self._structure), self.dim))
+        self._parent, self._coord = apprentice.monomial.monomialParents(self.dim, omax)
+        self._lower, self._factor = apprentice.monomial.monomialDerivatives(self.dim, omax)
 
     def setCoefficients(self):
-        # Need maximum extends of coefficients
-        lmax_p=np.max([r._pcoeff.shape[0]                           for r in self._RA])
-        lmax_q=np.max([r._qcoeff.shape[0] if hasattr(r, "n") else 0 for r in self._RA])
-        lmax = max(lmax_p, lmax_q)
-        self._PC = np.zeros((len(self._RA), lmax), dtype=np.float64)
-        for num, r in enumerate(self._RA): self._PC[num][:r._pcoeff.shape[0]] = r._pcoeff
-
-        # Denominator
-        if lmax_q > 0:
-            self._hasRationals = True
-            self._QC = np.zeros((len(self._RA), lmax), dtype=np.float64)
-            for num, r in enumerate(self._RA):
-                if hasattr(r, "n"):
-                    self._QC[num][:r._qcoeff.shape[0]] = r._qcoeff
-                else:
-                    self._QC[num][0] = None
-            self._mask = np.where(np.isfinite(self._QC[:, 0]))
-        else:
-            self._hasRationals = False
+        """
+        Group the bins into blocks of identical orders and type (polynomial
+        or rational) so that no coefficient vector needs to be padded.
+        """
+        keys = [(r.m, r.n, True) if hasattr(r, "n") else (r.m, 0, False) for r in self._RA]
+        blocks = []
+        for m, n, isRational in sorted(set(keys)):
+            idx = np.array([num for num, k in enumerate(keys) if k == (m, n, isRational)])
+            PC = np.array([self._RA[i]._pcoeff for i in idx], dtype=np.float64)
+            QC = np.array([self._RA[i]._qcoeff for i in idx], dtype=np.float64) if isRational else None
+            blocks.append(AppBlock(idx, m, n, PC, QC))
+        self.setBlocks(blocks)
+
+    def setBlocks(self, blocks):
+        self._blocks = blocks
+        self._hasRationals = any([B.isRational for B in blocks])
+        nbins = sum([len(B) for B in blocks])
+        self._blockOf    = np.empty(nbins, dtype=np.int64)
+        self._posInBlock = np.empty(nbins, dtype=np.int64)
+        for num, B in enumerate(blocks):
+            self._blockOf[B.idx]    = num
+            self._posInBlock[B.idx] = np.arange(len(B))
+        self._fullsel = [(B, slice(None, None, None), B.idx) for B in blocks]
+
+    def selectBlocks(self, sel):
+        """
+        Translate the bin selection sel into a list of
+        (block, rows in block, positions in output) and the number of selected bins.
+        """
+        if isinstance(sel, slice) and sel == slice(None, None, None):
+            return self._fullsel, len(self._blockOf)
+        isel = np.arange(len(self._blockOf))[sel]
+        bsel = self._blockOf[isel]
+        ret = []
+        for num, B in enumerate(self._blocks):
+            pos = np.where(bsel == num)[0]
+            if len(pos) > 0: ret.append((B, self._posInBlock[isel[pos]], pos))
+        return ret, len(isel)
 
     def setRecurrence(self, x):
-        xs = self._SCLR.scale(x)
-        self._maxrec = self.recurrence(xs, self._structure)
+        xs = self._SCLR.scale(np.atleast_1d(x))
+        self._maxrec = apprentice.monomial.recurrenceParents(xs, self._parent, self._coord)
 
     def vals(self, x, sel=slice(None, None, None), set_cache=True, maxorder=None):
         if set_cache: self.setRecurrence(x)
-        if maxorder is None:
-            MM=self._maxrec * self._PC[sel]
-        else:
-            nc = apprentice.tools.numCoeffsPoly(self.dim, 2)
-            MM=self._maxrec[:nc] * self._PC[sel][:,:nc]
-        vals = np.sum(MM, axis=1)
-        if self._hasRationals:
-            den = np.sum(self._maxrec * self._QC[sel], axis=1)
-            vals/=den
-            # FIXME this logic with the mask is not working
-            # The code will divide by zero in case we hav mixed bits here
-            # Note that this will go away come federations
-            # vals[self._mask[sel]] /= den[self._mask[sel]]
+        blocks, nsel = self.selectBlocks(sel)
+        vals = np.empty(nsel, dtype=np.float64)
+        for B, rows, pos in blocks:
+            nc = B.ncp if maxorder is None else min(B.ncp, apprentice.tools.numCoeffsPoly(self.dim, maxorder))
+            V = B.PC[rows][:, :nc] @ self._maxrec[:nc]
+            if B.isRational:
+                V /= B.QC[rows] @ self._maxrec[:B.ncq]
+            vals[pos] = V
         return vals
 
     def grads(self, x, sel=slice(None, None, None), set_cache=True):
         if set_cache: self.setRecurrence(x)
-        xs = self._SCLR.scale(x)
-        JF = self._SCLR.jacfac
-        GREC = apprentice.tools.gradientRecursionFast(xs, self._structure, self._SCLR.jacfac, self._NNZ, self._sred)
-
-        # NOTE this is expensive -- pybind11??
-        # Pprime = np.sum(self._PC[sel].reshape((self._PC[sel].shape[0], 1, self._PC[sel].shape[1])) * GREC, axis=2)
-        Pprime = prime(GREC, self._PC[sel], self.dim, self._NNZ)
-
-        if self._hasRationals:
-            P = np.atleast_2d(np.sum(self._maxrec * self._PC[sel], axis=1))
-            Q = np.atleast_2d(np.sum(self._maxrec * self._QC[sel], axis=1))
-            Qprime = prime(GREC, self._QC[sel], self.dim, self._NNZ)
-            return np.array(Pprime/Q.transpose() - (P/Q/Q).transpose()*Qprime, dtype=np.float64)
+        xs = self._SCLR.scale(np.atleast_1d(x))
+        GREC = gradientRecurrence(xs, self._S2D, self._SCLR.jacfac)
+        blocks, nsel = self.selectBlocks(sel)
+        grads = np.empty((nsel, self.dim), dtype=np.float64)
+        for B, rows, pos in blocks:
+            PC = B.PC[rows]
+            Pprime = prime(GREC[:, :B.ncp], PC)
+            if B.isRational:
+                QC = B.QC[rows]
+                P = PC @ self._maxrec[:B.ncp]
+                Q = QC @ self._maxrec[:B.ncq]
+                Qprime = prime(GREC[:, :B.ncq], QC)
+                grads[pos] = Pprime/Q[:, np.newaxis] - (P/Q/Q)[:, np.newaxis]*Qprime
+            else:
+                grads[pos] = Pprime
+        return grads
 
-        return np.array(Pprime, dtype=np.float64)
+    def vals_and_grads(self, x, sel=slice(None, None, None)):
+        """
+        Values and gradients at x from a single recurrence and a single
+        pass over the coefficient blocks.
+        """
+        self.setRecurrence(x)
+        xs = self._SCLR.scale(np.atleast_1d(x))
+        GREC = gradientRecurrence(xs, self._S2D, self._SCLR.jacfac)
+        blocks, nsel = self.selectBlocks(sel)
+        vals  = np.empty(nsel, dtype=np.float64)
+        grads = np.empty((nsel, self.dim), dtype=np.float64)
+        for B, rows, pos in blocks:
+            PC = B.PC[rows]
+            P = PC @ self._maxrec[:B.ncp]
+            Pprime = prime(GREC[:, :B.ncp], PC)
+            if B.isRational:
+                QC = B.QC[rows]
+                Q = QC @ self._maxrec[:B.ncq]
+                Qprime = prime(GREC[:, :B.ncq], QC)
+                vals[pos]  = P/Q
+                grads[pos] = Pprime/Q[:, np.newaxis] - (P/Q/Q)[:, np.newaxis]*Qprime
+            else:
+                vals[pos]  = P
+                grads[pos] = Pprime
+        return vals, grads
 
-    # @jit(forceobj=True)#, parallel=True)
     def hessians(self, x, sel=slice(None, None, None)):
         """
         To get the hessian matrix of bin number N, do
         H=hessians(pp)
         H[:,:,N]
         """
-        xs = self._SCLR.scale(x)
-
-        NSEL = len(self._PC[sel])
-
-        Phess = doubleprime(self.dim, xs, NSEL, self._HH, self._HNONZ, self._EE, self._PC[sel])
+        xs = self._SCLR.scale(np.atleast_1d(x))
+        HREC = hessianRecurrence(xs, self._S2D, self._SCLR.jacfac)
+        if self._hasRationals: GREC = gradientRecurrence(xs, self._S2D, self._SCLR.jacfac)
+        blocks, nsel = self.selectBlocks(sel)
+        hess = np.empty((self.dim, self.dim, nsel), dtype=np.float64)
+        for B, rows, pos in blocks:
+            PC = B.PC[rows]
+            Phess = doubleprime(HREC[:, :, :B.ncp], PC)
+
+            #TODO check against autograd?
+            if B.isRational:
+                QC = B.QC[rows]
+                P = PC @ self._maxrec[:B.ncp]
+                Q = QC @ self._maxrec[:B.ncq]
+                Pprime = prime(GREC[:, :B.ncp], PC)
+                Qprime = prime(GREC[:, :B.ncq], QC)
+                Qhess = doubleprime(HREC[:, :, :B.ncq], QC)
+
+                w = Phess/Q
+                for numx in range(self.dim):
+                    for numy in range(self.dim):
+                        w[numx][numy] -=   (Pprime[:,numx]*Qprime[:,numy] + Pprime[:,numy]*Qprime[:,numx])/Q/Q
+                        w[numx][numy] += 2*(Qprime[:,numx]*Qprime[:,numy]*P/Q/Q/Q)
+
+                w -= Qhess*(P/Q/Q)
+                hess[:, :, pos] = w
+            else:
+                hess[:, :, pos] = Phess
+        return hess
 
-        #TODO check against autograd?
-        if self._hasRationals:
-            JF = self._SCLR.jacfac
-            GREC = apprentice.tools.gradientRecursionFast(xs, self._structure, self._SCLR.jacfac, self._NNZ, self._sred)
-            P = np.atleast_2d(np.sum(self._maxrec * self._PC[sel], axis=1))
-            Q = np.atleast_2d(np.sum(self._maxrec * self._QC[sel], axis=1))
-            Pprime = np.atleast_2d(prime(GREC, self._PC[sel], self.dim, self._NNZ))
-            Qprime = np.atleast_2d(prime(GREC, self._QC[sel], self.dim, self._NNZ))
-            Qhess = doubleprime(self.dim, xs, NSEL, self._HH, self._HNONZ, self._EE, self._QC[sel])
+    def recurrenceMany(self, X):
+        """
+        Recurrence matrix of shape (ncoeffs, npoints) for many points X.
+        """
+        XS = self._SCLR.scale(np.reshape(X, (-1, self.dim)))
+        return apprentice.monomial.recurrenceParentsMany(XS, self._parent, self._coord)
 
-            w = Phess/Q
-            for numx in range(self.dim):
-                for numy in range(self.dim):
-                    w[numx][numy] -= 2*(Pprime[:,numx]*Qprime[:,numy]/Q/Q).flatten()
-                    w[numx][numy] += 2*(Qprime[:,numx]*Qprime[:,numy]*P/Q/Q/Q).flatten()
+    def vals_many(self, X, sel=slice(None, None, None)):
+        """
+        Evaluate all (selected) bins at many points X at once.
+        Returns an array of shape (npoints, nbins) such that
+        vals_many(X)[i] equals vals(X[i]).
+        """
+        REC = self.recurrenceMany(X)
+        blocks, nsel = self.selectBlocks(sel)
+        vals = np.empty((REC.shape[1], nsel), dtype=np.float64)
+        for B, rows, pos in blocks:
+            V = B.PC[rows] @ REC[:B.ncp]
+            if B.isRational:
+                V /= B.QC[rows] @ REC[:B.ncq]
+            vals[:, pos] = V.T
+        return vals
 
-            w -= Qhess*(P/Q/Q)
-            return w
+    def grads_many(self, X, sel=slice(None, None, None)):
+        """
+        Gradients of all (selected) bins at many points X at once.
+        Returns an array of shape (npoints, nbins, dim) such that
+        grads_many(X)[i] equals grads(X[i]).
+        """
+        XS = self._SCLR.scale(np.reshape(X, (-1, self.dim)))
+        # The derivatives of the monomials are monomials, c.f. tools.gradientRecursionMany
+        REC  = apprentice.monomial.recurrenceParentsMany(XS, self._parent, self._coord)
+        GREC = (self._SCLR.jacfac[:, np.newaxis] * self._factor)[:, :, np.newaxis] * REC[self._lower]
+        blocks, nsel = self.selectBlocks(sel)
+        grads = np.empty((len(XS), nsel, self.dim), dtype=np.float64)
+        for B, rows, pos in blocks:
+            PC = B.PC[rows]
+            Pprime = np.einsum("bc,dcp->pbd", PC, GREC[:, :B.ncp])
+            if B.isRational:
+                QC = B.QC[rows]
+                P = (PC @ REC[:B.ncp]).T[:, :, np.newaxis]
+                Q = (QC @ REC[:B.ncq]).T[:, :, np.newaxis]
+                Qprime = np.einsum("bc,dcp->pbd", QC, GREC[:, :B.ncq])
+                grads[:, pos] = Pprime/Q - P/Q/Q*Qprime
+            else:
+                grads[:, pos] = Pprime
+        return grads
 
-        return Phess
+    def wraps(self, V, sel=slice(None, None, None)):
+        """
+        Mask of the selected bins whose [vmin, vmax] contains V --- bins
+        without that information always wrap.
+        """
+        vmin, vmax = self._vmin[sel], self._vmax[sel]
+        return np.logical_or(np.logical_or(np.isnan(vmin), np.isnan(vmax)), np.logical_and(vmin <= V, V <= vmax))
 
+    def sameScaler(self):
+        """
+        Mask of bins whose approximation uses the scaler of this set.
+        """
+        return self._samescaler
 
-    def __len__(self): return len(self._RA)
+    def unifyScaler(self):
+        """
+        Express the bins with a different scaler in the scaled coordinates of the
+        most common one, which becomes the scaler of this set. The scaled coordinates
+        of two scalers are related by y_b = alpha*y + beta, p(alpha*y + beta) is again
+        a polynomial of the same order (c.f. monomial.affineSubstitution) --- the
+        values of the approximations do not change.
+        """
+        if np.all(self._samescaler): return
+        scalers, which = [], np.empty(len(self), dtype=np.int64)
+        for num, r in enumerate(self._RA):
+            for k, s in enumerate(scalers):
+                if r._scaler is s or r._scaler == s: break
+            else:
+                k = len(scalers)
+                scalers.append(r._scaler)
+            which[num] = k
+        SCLR = scalers[np.argmax(np.bincount(which))]
+        for num in np.where(which != np.argmax(np.bincount(which)))[0]:
+            S = self._RA[num]._scaler
+            alpha = S._scaleTerm / SCLR._scaleTerm
+            beta  = S._scaleTerm * (SCLR._Xmin - S._Xmin) - alpha * SCLR._a + S._a
+            B, row = self._blocks[self._blockOf[num]], self._posInBlock[num]
+            B.PC[row] = apprentice.monomial.affineSubstitution(B.PC[row], self.dim, B.m, alpha, beta)
+            if B.isRational: B.QC[row] = apprentice.monomial.affineSubstitution(B.QC[row], self.dim, B.n, alpha, beta)
+        self._SCLR = SCLR
+        self._samescaler = np.ones(len(self), dtype=bool)
+        self._bounds = SCLR.box
+
+    def screenPoles(self, nsamples=4096, tol=0.1, seed=None, chunksize=2**24, maxsize=2**16):
+        """
+        Pole screening of all rational bins at once. The denominators are evaluated
+        on a shared quasi-random sample of the scaled box plus its corners (one
+        recurrence, one matrix product per block). Only bins without a sign change whose smallest |q| is below
+        tol times the largest are looked at individually --- with
+        tools.polyChangesSignBernstein if their Bernstein tensor has at most maxsize
+        entries and the check is conclusive, else by local optimisation.
+        Returns qmin and pole, where qmin is the smallest value of s*q found (s being
+        the dominant sign of q, nan for polynomials) and pole flags qmin <= 0.
+        """
+        box = self._SCLR.box_scaled
+        XS = apprentice.tools.quasiRandomBox(box, nsamples, seed)
+        if 2**self.dim <= nsamples:
+            # Extrema of polynomials like to sit in the corners of the box
+            import itertools
+            XS = np.vstack((XS, np.array([b for b in itertools.product(*box)], dtype=np.float64)))
+        REC = apprentice.monomial.recurrenceParentsMany(XS, self._parent, self._coord)
+        qmin = np.full(len(self), np.nan)
+        for B in self._blocks:
+            if not B.isRational: continue
+            struct = apprentice.monomialStructure(self.dim, B.n)
+            step = max(1, chunksize // REC.shape[1])
+            for start in range(0, len(B), step):
+                QC = np.asarray(B.QC[start:start+step])
+                Q = QC @ REC[:B.ncq]
+                sgn = np.where(Q.max(axis=1) + Q.min(axis=1) >= 0, 1., -1.)
+                SQ = sgn[:, np.newaxis] * Q
+                lo, hi = SQ.min(axis=1), SQ.max(axis=1)
+                for i in np.where((lo > 0) & (lo < tol * hi))[0]:
+                    if self._debug: print("Checking denominator of {}".format(self._binids[B.idx[start+i]]))
+                    bad = None
+                    if (B.n+1)**self.dim <= maxsize:
+                        bad, xmin, xmax = apprentice.tools.polyChangesSignBernstein(sgn[i] * QC[i], struct, box)
+                    if bad:
+                        lo[i] = sgn[i] * QC[i] @ apprentice.monomial.recurrenceParents(xmin, self._parent[:B.ncq], self._coord[:B.ncq])
+                    elif bad is None:
+                        x, f = apprentice.tools.polyPolishBox(sgn[i] * QC[i], self.dim, B.n, box, XS[[np.argmin(SQ[i])]])
+                        lo[i] = min(lo[i], f)
+                qmin[B.idx[start:start+step]] = lo
+        return qmin, qmin <= 0
+
+    def __len__(self): return len(self._binids)
 
     def rbox(self, ntrials):
         return np.random.uniform(low=self._SCLR._Xmin, high=self._SCLR._Xmax, size=(ntrials, self._SCLR.dim))
@@ -325,22 +587,17 @@ class TuningObjective2(object):
         self._debug = kwargs["debug"] if kwargs.get("debug") is not None else False
 
     def envelope(self):
-        if hasattr(self._RA[0], 'vmin') and hasattr(self._RA[0], "vmax"):
-            if self._RA[0].vmin is None or self._RA[0].vmax is None:
-                return np.where(self._Y)  # use everything
-
-            VMIN = np.array([r.vmin for r in self._RA])
-            VMAX = np.array([r.vmax for r in self._RA])
-            return np.where(np.logical_and(VMAX > self._Y, VMIN < self._Y))
-        else:
+        VMIN, VMAX = self._AS._vmin, self._AS._vmax
+        if np.any(np.isnan(VMIN)) or np.any(np.isnan(VMAX)):
             return np.where(self._Y)  # use everything
+        return np.where(np.logical_and(VMAX > self._Y, VMIN < self._Y))
 
     def mkFromFiles(self, f_weights, f_data, f_approx, f_errors=None, **kwargs):
         AS = AppSet(f_approx)
         hnames  = [    b.split("#")[0]  for b in AS._binids]
         bnums   = [int(b.split("#")[1]) for b in AS._binids]
-        blow    = [float(ra.xmin) if ra.xmin is not None else None for ra in AS._RA]
-        bup     = [float(ra.xmax) if ra.xmax is not None else None for ra in AS._RA]
+        blow    = [float(x) if not np.isnan(x) else None for x in AS._xmin]
+        bup     = [float(x) if not np.isnan(x) else None for x in AS._xmax]
         weights = self.initWeights(f_weights, hnames, bnums, blow, bup)
         if sum(weights)==0:
             raise Exception("No observables selected. Check weight file and if it is compatible with experimental data supplied.")
@@ -352,14 +609,15 @@ class TuningObjective2(object):
         E = np.array([dd[b][1] for b in AS._binids[nonzero]], dtype=np.float64)
 
         # Filter for wanted bins here and get rid of division by zero in case of 0 error which is undefined behaviour
+        samescaler = AS.sameScaler()
+        wraps = AS.wraps(Y, nonzero)
         good = []
         for num, bid in enumerate(AS._binids[nonzero]):
             if E[num] > 0:
-                _num = np.where(AS._binids==bid)[0][0]
-                if AS._RA[0]._scaler != AS._RA[_num]._scaler:
+                if not samescaler[nonzero[0][num]]:
                     if self._debug: print("Warning, dropping bin with id {} to guarantee caching works".format(bid))
                     continue
-                if not AS._RA[_num].wraps(Y[num]):
+                if not wraps[num]:
                     if self._debug: print("Warning, dropping bin with id {} as it is not wrapping the data".format(bid))
                     continue
                 else:
@@ -374,9 +632,9 @@ class TuningObjective2(object):
             raise Exception("No bins left after filtering.")
 
         # TODO This needs some re-engineering to allow fow multiple filterings
-        RA =           [AS._RA[nonzero][g]     for g in good]
-        self._binids = [AS._binids[nonzero][g] for g in good]
-        self._AS = AppSet(RA, self._binids)
+        keep = nonzero[0][good]
+        self._binids = AS._binids[keep]
+        self._AS = AppSet(AS, keep)
         self._E = E[good]
         self._Y = Y[good]
         self._W2 = np.array([w * w for w in np.array(weights[nonzero])[good]], dtype=np.float64)
@@ -384,8 +642,7 @@ class TuningObjective2(object):
         # Add in error approximations
         if f_errors is not None:
             EAS = AppSet(f_errors)
-            ERA = [EAS._RA[g] for g in good]
-            self._EAS=AppSet(ERA, self._binids)
+            self._EAS=AppSet(EAS, keep)
         else:
             self._EAS=None
         self.setAttributes(**kwargs)
@@ -423,6 +680,30 @@ class TuningObjective2(object):
         x[self._freeIdx] = _x
         return x
 
+    def mkPoints(self, _X):
+        X=np.empty((len(_X), self._dim), dtype=np.float64)
+        X[:, self._fixIdx[0]] = self._fixVal
+        X[:, self._freeIdx[0]] = _X
+        return X
+
+    def objectives(self, _X, sel=slice(None, None, None), unbiased=False, chunksize=None):
+        """
+        Batched version of objective --- evaluates the objective at
+        all points in _X, processing chunksize points per matrix product.
+        """
+        X = self.mkPoints(np.atleast_2d(_X))
+        W2 = np.ones_like(self._W2[sel]) if unbiased else self._W2[sel]
+        if chunksize is None: chunksize = max(1, int(2**24/max(1, len(W2))))
+        ret = np.empty(len(X), dtype=np.float64)
+        for i in range(0, len(X), chunksize):
+            vals = self._AS.vals_many(X[i:i+chunksize], sel=sel)
+            if self._EAS is not None:
+                err2 = self._EAS.vals_many(X[i:i+chunksize], sel=sel)**2
+            else:
+                err2 = np.zeros_like(vals)
+            ret[i:i+chunksize] = np.sum(W2 * (self._Y[sel] - vals)**2 / (err2 + 1./self._E2[sel]), axis=1)
+        return ret
+
     def objective(self, _x, sel=slice(None, None, None), unbiased=False):
         x=self.mkPoint(_x)
         vals = self._AS.vals(x, sel=sel)
@@ -434,17 +715,25 @@ class TuningObjective2(object):
         else:        return apprentice.tools.fast_chi(self._W2[sel]     , self._Y[sel] - vals, 1./(err2 + 1./self._E2[sel]))# self._E2[sel])
 
     def gradient(self, _x, sel=slice(None, None, None)):
+        return self.value_and_grad(_x, sel=sel)[1]
+
+    def value_and_grad(self, _x, sel=slice(None, None, None)):
+        """
+        Objective and gradient at _x --- each AppSet is evaluated once,
+        use with jac=True in scipy's minimize.
+        """
         x=self.mkPoint(_x)
-        vals  = self._AS.vals( x, sel=sel)
+        vals, grads = self._AS.vals_and_grads(x, sel=sel)
         E2=1./self._E2[sel]
-        grads = self._AS.grads(x, sel=sel, set_cache=False)
         if self._EAS is not None:
-            err   = self._EAS.vals(  x, sel=sel, set_cache=False)
-            egrads = self._EAS.grads( x, sel=sel, set_cache=False)
+            err, egrads = self._EAS.vals_and_grads(x, sel=sel)
         else:
             err= np.zeros_like(vals)
             egrads = np.zeros_like(grads)
-        return apprentice.tools.fast_grad2(self._W2[sel], self._Y[sel] - vals, E2, err, grads, egrads)[self._freeIdx]
+        d = self._Y[sel] - vals
+        val  = apprentice.tools.fast_chi(self._W2[sel], d, 1./(err*err + E2))
+        grad = apprentice.tools.fast_grad2(self._W2[sel], d, E2, err, grads, egrads)[self._freeIdx]
+        return val, grad
 
     def hessian(self, _x, sel=slice(None, None, None)):
         x=self.mkPoint(_x)
@@ -499,10 +788,10 @@ class TuningObjective2(object):
         else:
             raise Exception("Startpoint sampling method {} not known, exiting".format(method))
 
-        _CH = [self.objective(p, sel=sel) for p in _PP]
+        _CH = self.objectives(_PP, sel=sel)
         t1=time.time()
-        if self._debug: print("StartPoint: {}, evaluation took {} seconds".format(_PP[_CH.index(min(_CH))], t1-t0))
-        return _PP[_CH.index(min(_CH))]
+        if self._debug: print("StartPoint: {}, evaluation took {} seconds".format(_PP[np.argmin(_CH)], t1-t0))
+        return _PP[np.argmin(_CH)]
 
     def startPointMPI(self, ntrials, sel=slice(None, None, None)):
         from mpi4py import MPI
@@ -511,9 +800,9 @@ class TuningObjective2(object):
         XX = self.rbox(ntrials)
         rankWork = apprentice.tools.chunkIt(XX, comm.Get_size()) if rank == 0 else []
         rankWork = comm.scatter(rankWork, root=0)
-        temp = [self.objective(x, sel=sel) for x in rankWork]
+        temp = self.objectives(rankWork, sel=sel)
         ibest = np.argmin(temp)
-        X = comm.gather(XX[ibest], root=0)
+        X = comm.gather(rankWork[ibest], root=0)
         FUN = comm.gather(temp[ibest], root=0)
         xbest = None
         if rank == 0:
@@ -697,9 +986,9 @@ class TuningObjective2(object):
     def minimizeTrust(self, x0, sel=slice(None, None, None), tol=1e-6):
         from scipy import optimize
         res = optimize.minimize(
-                lambda x: self.objective(x, sel=sel),
+                lambda x: self.value_and_grad(x, sel=sel),
                 x0,
-                jac=lambda x:self.gradient(x, sel=sel),
+                jac=True,
                 hess=lambda x:self.hessian(x, sel=sel),
                 method="trust-exact")
         return res
@@ -707,9 +996,9 @@ class TuningObjective2(object):
     def minimizeNCG(self, x0, sel=slice(None, None, None), tol=1e-6):
         from scipy import optimize
         res = optimize.minimize(
-                lambda x: self.objective(x, sel=sel),
+                lambda x: self.value_and_grad(x, sel=sel),
                 x0,
-                jac=lambda x:self.gradient(x, sel=sel),
+                jac=True,
                 hess=lambda x:self.hessian(x, sel=sel),
                 method="Newton-CG")
         return res
@@ -717,20 +1006,20 @@ class TuningObjective2(object):
     def minimizeTNC(self, x0, sel=slice(None, None, None), tol=1e-6):
         from scipy import optimize
         res = optimize.minimize(
-                lambda x: self.objective(x, sel=sel),
+                lambda x: self.value_and_grad(x, sel=sel),
                 x0,
                 bounds=self._bounds[self._freeIdx],
-                jac=lambda x:self.gradient(x, sel=sel),
+                jac=True,
                 method="TNC", tol=tol, options={'maxiter':1000, 'accuracy':tol})
         return res
 
     def minimizeLBFGSB(self, x0, sel=slice(None, None, None), tol=1e-6):
         from scipy import optimize
         res = optimize.minimize(
-                lambda x: self.objective(x, sel=sel),
+                lambda x: self.value_and_grad(x, sel=sel),
                 x0,
                 bounds=self._bounds[self._freeIdx],
-                jac=lambda x:self.gradient(x, sel=sel),
+                jac=True,
                 method="L-BFGS-B", tol=tol)
         return res
 
@@ -1,12 +1,15 @@
 import apprentice as app
-from mpi4py import MPI
 
-def readInputDataH5(fname, wfile=None, comm=MPI.COMM_WORLD):
+def readInputIndexH5(fname, wfile=None, comm=None):
+    """
+    Row numbers of the bins to use (all or those of the observables in wfile),
+    the binids, parameter names and bin edges (nan if not stored) of the input file fname,
+    read on rank 0 and broadcast to all ranks of comm (default: c.f. app.tools.worldComm).
+    """
     import apprentice as app
     import numpy as np
     import h5py
-    # comm = MPI.COMM_WORLD
-    size = comm.Get_size()
+    if comm is None: comm = app.tools.worldComm()
     rank = comm.Get_rank()
 
     pnames, binids, IDX, xmin, xmax = None, None, None, None, None
@@ -18,17 +21,46 @@ def readInputDataH5(fname, wfile=None, comm=MPI.COMM_WORLD):
         binids      = app.io.readIndexH5(fname)
 
         with h5py.File(fname, "r") as f:
-            xmin = f["xmin"][:]
-            xmax = f["xmax"][:]
+            # Files written before the bin edges were stored do not have them
+            xmin = f["xmin"][:] if "xmin" in f else np.full(len(binids), np.nan)
+            xmax = f["xmax"][:] if "xmax" in f else np.full(len(binids), np.nan)
     pnames  = comm.bcast(pnames     , root=0)
     binids  = comm.bcast(binids     , root=0)
+    IDX     = comm.bcast(IDX, root=0)
     xmin    = comm.bcast(xmin, root=0)
     xmax    = comm.bcast(xmax, root=0)
+    return IDX, np.array(binids), pnames, xmin, xmax
 
+def readInputDataH5(fname, wfile=None, comm=None):
+    import apprentice as app
+    import numpy as np
+    if comm is None: comm = app.tools.worldComm()
+    size = comm.Get_size()
+    rank = comm.Get_rank()
+
+    IDX, binids, pnames, xmin, xmax = readInputIndexH5(fname, wfile, comm)
     rankIdx = app.tools.chunkIt(IDX, size) if rank==0 else None
     rankIdx = comm.scatter(rankIdx, root=0)
     DATA    = app.io.readH5(fname, rankIdx)
-    return DATA, np.array(binids)[rankIdx], pnames, rankIdx, xmin[rankIdx], xmax[rankIdx]
+    return DATA, binids[rankIdx], pnames, rankIdx, xmin[rankIdx], xmax[rankIdx]
+
+def readRowsH5(dset, idx):
+    """
+    The rows idx of the HDF5 dataset dset. Only those rows are read, one
+    hyperslab per run of consecutive row numbers.
+    """
+    import numpy as np
+    U, inv = np.unique(np.asarray(idx, dtype=np.int64), return_inverse=True)
+    if len(U) == 0: return np.empty((0,) + dset.shape[1:], dtype=dset.dtype)
+    runs = np.split(U, np.where(np.diff(U) != 1)[0] + 1)
+    return np.concatenate([dset[r[0]:r[-1]+1] for r in runs])[inv]
+
+def rowChunks(nrows, ncols, itemsize=8, target=2**20):
+    """
+    Number of rows per chunk such that a chunk of full rows
+    of a (nrows x ncols) dataset is about target bytes.
+    """
+    return int(max(1, min(nrows, target/(itemsize*max(1, ncols)))))
 
 def readH5(fname, idx=None, xfield="params", yfield1="values", yfield2="errors"):
     """
@@ -54,10 +86,10 @@ def readH5(fname, idx=None, xfield="params", yfield1="values", yfield2="errors")
 
         # Read parameters
         _X = np.array(f.get(xfield))
-        Y = f.get(yfield1)[:][idx]
+        Y = readRowsH5(f.get(yfield1), idx)
 
         if yfield2 in f:
-            E = f.get(yfield2)[:][idx]
+            E = readRowsH5(f.get(yfield2), idx)
             # Read y-values
             for i in range(len(idx)):
                 _Y = Y[i]
@@ -72,23 +104,33 @@ def readH5(fname, idx=None, xfield="params", yfield1="values", yfield2="errors")
     f.close()
     return ret
 
-def readInputDataYODA(dirnames, parFileName="params.dat", wfile=None, storeAsH5=None, comm = MPI.COMM_WORLD):
+def readInputDataYODA(dirnames, parFileName="params.dat", wfile=None, storeAsH5=None, comm=None, batchsize=None, jobs=1):
+    """
+    Read the run directories in dirnames. With storeAsH5 and batchsize given,
+    the data are streamed into the HDF5 file storeAsH5 (see writeInputDataYODAH5)
+    which is then read back like any other HDF5 input.
+    """
     import apprentice as app
     import numpy as np
-    import yoda, glob, os
+    import yoda
+    if comm is None: comm = app.tools.worldComm()
     size = comm.Get_size()
     rank = comm.Get_rank()
 
+    if storeAsH5 is not None and batchsize is not None:
+        writeInputDataYODAH5(dirnames, storeAsH5, parFileName, wfile, batchsize=batchsize, comm=comm, jobs=jobs)
+        return readInputDataH5(storeAsH5, wfile, comm=comm)
+
     indirs=None
     if rank==0:
-        INDIRSLIST = [glob.glob(os.path.join(a, "*")) for a in dirnames]
+        INDIRSLIST = [app.io.listdir(a, dirsonly=True) for a in dirnames]
         indirs     = [item for sublist in INDIRSLIST for item in sublist]
     indirs = comm.bcast(indirs, root=0)
 
     rankDirs = app.tools.chunkIt(indirs, size) if rank==0 else None
     rankDirs = comm.scatter(rankDirs, root=0)
 
-    PARAMS, HISTOS = app.io.read_rundata(rankDirs, parFileName)
+    PARAMS, HISTOS = app.io.read_rundata(rankDirs, parFileName, jobs=jobs)
     send = []
     for k, v in HISTOS.items():
         temp = []
@@ -116,43 +158,23 @@ def readInputDataYODA(dirnames, parFileName="params.dat", wfile=None, storeAsH5=
 
         pnames = [str(x) for x in _params[list(_params.keys())[0]].keys()]
         runs = sorted(list(_params.keys()))
-        X=np.array([list(_params[r].values()) for r in runs])
-
-        # Iterate through all histos, bins and mc runs to rearrange data
-        hbins ={}
-        HNAMES=[str(x) for x in sorted(list(_histos.keys()))]
-        if wfile is not None:
-            observables = list(set(app.io.readObs(wfile)))
-            HNAMES = [hn for hn in HNAMES if hn in observables]
-        BNAMES = []
-        for hn in HNAMES:
-            histos = _histos[hn]
-            nbins = len(list(histos.values())[0])
-            hbins[hn]=nbins
-            for n in range(nbins):
-                BNAMES.append("%s#%i"%(hn, n))
-
-        _data, xmin, xmax = [], [], []
-        for hn in HNAMES:
-            for nb in range(hbins[hn]):
-                vals = [_histos[hn][r][nb][2] if r in _histos[hn].keys() else np.nan for r in runs]
-                errs = [_histos[hn][r][nb][3] if r in _histos[hn].keys() else np.nan for r in runs]
-                # Pick a run that actually exists here
-                goodrun = runs[np.where(np.isfinite(vals))[0][0]]
-                xmin.append(_histos[hn][goodrun][nb][0])
-                xmax.append(_histos[hn][goodrun][nb][1])
-                USE = np.where((~np.isinf(vals)) & (~np.isnan(vals)) & (~np.isinf(errs)) & (~np.isnan(errs)))
-                xg=X[USE,:]
-                if len(xg.shape)==3:
-                    xg=xg.reshape(xg.shape[1:])
-                _data.append([xg, np.array(vals)[USE], np.array(errs)[USE]])
+
+        # Same bin layout and container as the streaming writeInputDataYODAH5
+        HNAMES, NBINS, BNAMES, xmin, xmax = binLayout(dict([(hn, H[sorted(H.keys())[0]]) for hn, H in _histos.items()]), wfile)
+        P, V, E = app.io.denseRunBatch(runs, _params, _histos, pnames, HNAMES, NBINS)
+
+        _data = []
+        for vals, errs in zip(V, E):
+            USE = np.where((~np.isinf(vals)) & (~np.isnan(vals)) & (~np.isinf(errs)) & (~np.isnan(errs)))
+            _data.append([P[USE], vals[USE], errs[USE]])
 
         if storeAsH5 is not None:
-            writeInputDataSetH5(storeAsH5, _data, runs, BNAMES, pnames, xmin, xmax)
+            f = createInputDataH5(storeAsH5, BNAMES, pnames, xmin, xmax, chunksize=max(1, min(len(runs), 100)))
+            appendRunsH5(f, runs, P, V, E)
+            f.close()
 
         # TODO add weight file reading for obsevable filtering
-        observables = np.unique([x.split("#")[0] for x in BNAMES])
-        im   = {ls: np.where(np.char.find(BNAMES, ls) > -1)[0] for ls in observables}
+        im   = obsIndexMap(*mkObsIndex(BNAMES))
         IDX  = np.sort(np.concatenate(list(im.values())))
 
         rankIdx = app.tools.chunkIt(IDX, size)
@@ -172,6 +194,133 @@ def readInputDataYODA(dirnames, parFileName="params.dat", wfile=None, storeAsH5=
 
     return data, binids, pnames, rankIdx, xmin, xmax
 
+def denseRunBatch(runs, PARAMS, HISTOS, pnames, HNAMES, NBINS):
+    """
+    Rearrange the output of read_rundata for the runs into arrays --- the
+    parameter points (nruns x dim) and values and errors (nbins x nruns).
+    Bins of histograms missing in a run are NaN.
+    """
+    import numpy as np
+    P = np.array([[PARAMS[r][pn] for pn in pnames] for r in runs], dtype=np.float64).reshape((len(runs), len(pnames)))
+    V = np.full((sum(NBINS), len(runs)), np.nan)
+    E = np.full((sum(NBINS), len(runs)), np.nan)
+    offset = 0
+    for hn, nb in zip(HNAMES, NBINS):
+        if hn in HISTOS:
+            for ir, r in enumerate(runs):
+                if r in HISTOS[hn]:
+                    H = HISTOS[hn][r][:nb]
+                    V[offset:offset+len(H), ir] = [b[2] for b in H]
+                    E[offset:offset+len(H), ir] = [b[3] for b in H]
+        offset += nb
+    return P, V, E
+
+def binLayout(first, wfile=None):
+    """
+    Histogram names (sorted, only the observables in wfile if given), their number
+    of bins, the bin names and the bin edges --- first is a dictionary histogram
+    name -> bins (xmin, xmax, ...) of a run that has the histogram.
+    """
+    HNAMES = [str(x) for x in sorted(list(first.keys()))]
+    if wfile is not None:
+        observables = list(set(app.io.readObs(wfile)))
+        HNAMES = [hn for hn in HNAMES if hn in observables]
+    NBINS  = [len(first[hn]) for hn in HNAMES]
+    BNAMES = ["%s#%i"%(hn, n) for hn, nb in zip(HNAMES, NBINS) for n in range(nb)]
+    xmin   = [b[0] for hn in HNAMES for b in first[hn]]
+    xmax   = [b[1] for hn in HNAMES for b in first[hn]]
+    return HNAMES, NBINS, BNAMES, xmin, xmax
+
+def createInputDataH5(fname, BNAMES, pnames, xmin, xmax, chunksize=100, compression=4):
+    """
+    New input data file fname for the bins BNAMES without any runs, c.f. appendRunsH5.
+    The runs axis of the datasets is resizable and chunked in chunksize runs.
+    """
+    import h5py
+    import numpy as np
+    nbins = len(BNAMES)
+    f = h5py.File(fname, "w")
+    f.create_dataset("index", data=np.char.encode(BNAMES, encoding='utf8'),  compression=compression)
+    writeObsIndexH5(f, BNAMES, compression)
+    f.create_dataset("xmin", data=xmin, compression=compression)
+    f.create_dataset("xmax", data=xmax, compression=compression)
+    f.create_dataset("runs", (0,), maxshape=(None,), dtype=h5py.string_dtype('utf-8'), chunks=(chunksize,), compression=compression)
+    pset = f.create_dataset("params", (0, len(pnames)), maxshape=(None, len(pnames)), dtype=np.float64, chunks=(chunksize, len(pnames)), compression=compression)
+    pset.attrs["names"] = np.char.encode(pnames, encoding='utf8')
+    for name in ["values", "errors"]:
+        f.create_dataset(name, (nbins, 0), maxshape=(nbins, None), dtype=np.float64, chunks=(rowChunks(nbins, chunksize), chunksize), compression=compression)
+    return f
+
+def appendRunsH5(f, runs, P, V, E):
+    """
+    Append the runs with parameter points P and values V and errors E
+    (c.f. denseRunBatch) to the file f opened by createInputDataH5.
+    Returns the number of runs stored.
+    """
+    n0, n1 = f["params"].shape[0], f["params"].shape[0] + len(runs)
+    f["runs"].resize((n1,))
+    f["runs"][n0:n1] = runs
+    f["params"].resize((n1, f["params"].shape[1]))
+    f["params"][n0:n1] = P
+    for name, D in [("values", V), ("errors", E)]:
+        f[name].resize((f[name].shape[0], n1))
+        f[name][:, n0:n1] = D
+    return n1
+
+def writeInputDataYODAH5(dirnames, fname, parFileName="params.dat", wfile=None, batchsize=100, compression=4, comm=None, jobs=1):
+    """
+    Streaming version of readInputDataYODA(..., storeAsH5=fname). The run
+    directories are read in batches of batchsize runs (shared among the ranks)
+    and appended to resizable datasets so memory is bounded by
+    (batchsize x bins) rather than (runs x bins).
+    The bin layout (histograms, number of bins, bin edges) is taken from the first
+    batch --- histograms that do not appear in any of its runs are ignored. Otherwise
+    the file is the same as the one of readInputDataYODA, both filter the observables by wfile.
+    """
+    import apprentice as app
+    import numpy as np
+    if comm is None: comm = app.tools.worldComm()
+    size = comm.Get_size()
+    rank = comm.Get_rank()
+
+    indirs=None
+    if rank==0:
+        INDIRSLIST = [app.io.listdir(a, dirsonly=True) for a in dirnames]
+        indirs     = sorted([item for sublist in INDIRSLIST for item in sublist])
+    indirs = comm.bcast(indirs, root=0)
+
+    f, pnames, HNAMES, NBINS = None, None, None, None
+    for ib in range(0, len(indirs), batchsize):
+        batch = indirs[ib:ib+batchsize]
+        mine  = app.tools.chunkIt(batch, size)[rank]
+        PARAMS, HISTOS = app.io.read_rundata(mine, parFileName, jobs=jobs)
+
+        if ib == 0:
+            # Bin layout from the first batch
+            layout = comm.gather((PARAMS, dict([(hn, list(h.values())[0]) for hn, h in HISTOS.items()])), root=0)
+            if rank==0:
+                _params, _first = {}, {}
+                for p, h in layout:
+                    _params.update(p)
+                    for hn, H in h.items(): _first.setdefault(hn, H)
+                pnames = [str(x) for x in _params[list(_params.keys())[0]].keys()]
+                HNAMES, NBINS, BNAMES, xmin, xmax = binLayout(_first, wfile)
+                f = createInputDataH5(fname, BNAMES, pnames, xmin, xmax, chunksize=batchsize, compression=compression)
+            pnames = comm.bcast(pnames, root=0)
+            HNAMES = comm.bcast(HNAMES, root=0)
+            NBINS  = comm.bcast(NBINS,  root=0)
+
+        P, V, E = app.io.denseRunBatch(mine, PARAMS, HISTOS, pnames, HNAMES, NBINS)
+        del PARAMS, HISTOS
+        chunks = comm.gather((mine, P, V, E), root=0)
+        if rank==0:
+            n1 = appendRunsH5(f, [r for c in chunks for r in c[0]], np.vstack([c[1] for c in chunks]), np.hstack([c[2] for c in chunks]), np.hstack([c[3] for c in chunks]))
+            print("Stored {}/{} runs in {}".format(n1, len(indirs), fname))
+        del chunks
+
+    if rank==0: f.close()
+    comm.barrier()
+
 def writeInputDataSetH5(fname, data, runs, BNAMES, pnames, xmin, xmax, compression=4):
     import h5py
     import numpy as np
@@ -181,11 +330,14 @@ def writeInputDataSetH5(fname, data, runs, BNAMES, pnames, xmin, xmax, compressi
     # https://github.com/h5py/h5py/issues/892
     f.create_dataset("runs",  data=np.char.encode(runs,   encoding='utf8'),  compression=compression)
     f.create_dataset("index", data=np.char.encode(BNAMES, encoding='utf8'),  compression=compression)
+    writeObsIndexH5(f, BNAMES, compression)
     pset = f.create_dataset("params", data=data[0][0], compression=compression)
     pset.attrs["names"] = [x.encode('utf8') for x in pnames]
 
-    f.create_dataset("values", data=np.array([d[1] for d in data]), compression=compression)
-    f.create_dataset("errors", data=np.array([d[2] for d in data]), compression=compression)
+    # Chunks of full rows so that reading the data of a bin touches as few chunks as possible
+    V = np.array([d[1] for d in data])
+    f.create_dataset("values", data=V, chunks=(rowChunks(*V.shape), V.shape[1]), compression=compression)
+    f.create_dataset("errors", data=np.array([d[2] for d in data]), chunks=(rowChunks(*V.shape), V.shape[1]), compression=compression)
     f.create_dataset("xmin", data=xmin, compression=compression)
     f.create_dataset("xmax", data=xmax, compression=compression)
     f.close()
@@ -268,41 +420,68 @@ def read_paramsfile(path):
                 raise Exception("Error in parameter input format")
     return rtn
 
-def read_rundata(dirs, pfname="params.dat", verbosity=1):
+def listdir(d, dirsonly=False):
+    """
+    Non-hidden entries of directory d, like glob.glob(os.path.join(d, "*"))
+    but without pattern matching.
+    """
+    import os
+    with os.scandir(d) as it:
+        return [e.path for e in it if not e.name.startswith(".") and (not dirsonly or e.is_dir())]
+
+def read_rundir(d, pfname="params.dat"):
+    """
+    Read the params file and the histograms of a single run directory d.
+    """
+    import apprentice as app
+    import os, re
+    re_pfname = re.compile(pfname) if pfname else None
+    params, histos = None, {}
+    for f in app.io.listdir(d):
+        ## Params file
+        if re_pfname and re_pfname.search(os.path.basename(f)):
+            params = app.io.read_paramsfile(f)
+        else:
+            if f.endswith("yoda"):
+                try:
+                    # Read as a path -> Histo dict
+                    histos.update(app.io.read_histos(f))
+                except Exception as e:
+                    print("Whoopsiedoodles {}".format(e))
+                    pass #< skip files that can't be read as histos
+
+    # Check that a params file was found and read in this dir... or that no attempt was made to find one
+    if pfname and params is None:
+        raise Exception("No params file '%s' found in run dir '%s'" % (pfname, d))
+    return params, histos
+
+def read_rundata(dirs, pfname="params.dat", verbosity=1, jobs=1):
     """
     Read interpolation anchor point data from a provided set of run directory paths.
+    With jobs>1 the directories are parsed in a pool of that many processes.
     """
     import apprentice as app
     params, histos = {}, {}
-    import os, glob, re
-    re_pfname = re.compile(pfname) if pfname else None
+    dirs = sorted(dirs)
     numruns = len(dirs)
-    for num, d in enumerate(sorted(dirs)):
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from functools import partial
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(partial(app.io.read_rundir, pfname=pfname), dirs, chunksize=max(1, int(numruns/jobs/4)))
+    else:
+        pool = None
+        results = (app.io.read_rundir(d, pfname) for d in dirs)
+
+    for num, (d, (p, hs)) in enumerate(zip(dirs, results)):
         pct = 100*(num+1)/float(numruns)
         if (num+1)%100 == 0: print("Reading run '%s' data: %d/%d = %2.0f%%" % (d, num+1, numruns, pct))
-        files = glob.glob(os.path.join(d, "*"))
-        for f in files:
-            ## Params file
-            if re_pfname and re_pfname.search(os.path.basename(f)):
-                params[d] = app.io.read_paramsfile(f)
-            else:
-                if f.endswith("yoda"):
-                    try:
-                        # Read as a path -> Histo dict
-                        hs = app.io.read_histos(f)
-                        # Restructure into the path -> run -> Histo return dict
-                        for path, hist in hs.items():
-                            histos.setdefault(path, {})[d] = hist
-                    except Exception as e:
-                        print("Whoopsiedoodles {}".format(e))
-                        pass #< skip files that can't be read as histos
-
-        # Check that a params file was found and read in this dir... or that no attempt was made to find one
-        if pfname:
-            if d not in params.keys():
-                raise Exception("No params file '%s' found in run dir '%s'" % (pfname, d))
-        else:
-            params = None
+        params[d] = p
+        # Restructure into the path -> run -> Histo return dict
+        for path, hist in hs.items():
+            histos.setdefault(path, {})[d] = hist
+    if pool is not None: pool.shutdown()
+    if not pfname: params = None
     return params, histos
 
 def read_limitsandfixed(fname):
@@ -328,15 +507,55 @@ def readObs(fname):
         r = [l.strip().split()[0].split("#")[0].split("@")[0] for l in f if not l.startswith("#")]
     return r
 
+def mkObsIndex(BNAMES):
+    """
+    Observable -> row range index for the bin names BNAMES ("obs#num").
+    Returns the observable names and the start and stop rows of each
+    run of consecutive bins of that observable.
+    """
+    import numpy as np
+    hids = np.array([b.split("#")[0] for b in BNAMES])
+    if len(hids) == 0: return hids, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    start = np.concatenate(([0], np.where(hids[1:] != hids[:-1])[0] + 1))
+    stop  = np.append(start[1:], len(hids))
+    return hids[start], start.astype(np.int64), stop.astype(np.int64)
+
+def obsIndexMap(obsnames, start, stop, lsub=None):
+    """
+    Dictionary observable -> row numbers from an index written by mkObsIndex.
+    Observables in lsub that are not in the index map to an empty array.
+    """
+    import numpy as np
+    ranges = {}
+    for o, a, b in zip(obsnames, start, stop): ranges.setdefault(str(o), []).append(np.arange(a, b))
+    if lsub is None or len(lsub) == 0: lsub = list(ranges.keys())
+    return {ls: np.concatenate(ranges[ls]) if ls in ranges else np.array([], dtype=np.int64) for ls in lsub}
+
+def writeObsIndexH5(f, BNAMES, compression=4):
+    """
+    Persist the observable -> row range index of BNAMES in the open HDF5 file f.
+    """
+    import numpy as np
+    obsnames, start, stop = mkObsIndex(BNAMES)
+    f.create_dataset("obsnames", data=np.char.encode(obsnames.astype(str), encoding='utf8'), compression=compression)
+    f.create_dataset("obsstart", data=start, compression=compression)
+    f.create_dataset("obsstop",  data=stop,  compression=compression)
+
 def indexMapH5(fname, lsub):
     """
+    Dictionary observable -> row numbers in the HDF5 file fname. Files
+    without a persisted index get one built from the bin names.
     """
     import numpy as np
     import h5py
 
-    with h5py.File(fname, "r") as f: II = [x.decode() for x in f.get("index")[:]]
-    if len(lsub) == 0: lsub = np.unique([x.split("#")[0] for x in II])
-    return {ls: np.where(np.char.find(II, ls) > -1)[0] for ls in lsub}
+    with h5py.File(fname, "r") as f:
+        if "obsnames" in f:
+            obsnames = np.char.decode(f["obsnames"][()], encoding='utf8')
+            start, stop = f["obsstart"][()], f["obsstop"][()]
+        else:
+            obsnames, start, stop = mkObsIndex([x.decode() for x in f.get("index")[:]])
+    return obsIndexMap(obsnames, start, stop, lsub)
 
 
 def readIndexH5(fname):
@@ -349,6 +568,7 @@ def readObsNamesH5(fname):
     import h5py
     import numpy as np
     with h5py.File(fname, "r") as f:
+        if "obsnames" in f: return np.unique(np.char.decode(f["obsnames"][()], encoding='utf8'))
         return np.unique([x.decode().split("#")[0] for x in f.get("index")[:]])
 
 
@@ -396,21 +616,82 @@ def readApprentice(fname):
         app = apprentice.PolynomialApproximation(fname=fname)
     return app
 
-def yodaDir2Dict(dname):
+def yodaCacheName(dname):
+    """
+    Location of the on-disk cache of yodaDir2Dict for directory dname ---
+    inside $APPRENTICE_CACHE if set, ~/.cache/apprentice otherwise.
+    """
+    import os, hashlib
+    cdir = os.environ.get("APPRENTICE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "apprentice"))
+    return os.path.join(cdir, "refdata_{}.npz".format(hashlib.sha1(os.path.realpath(dname).encode()).hexdigest()))
+
+def yodaFile2Arrays(fname):
     """
-    Recursively find and read all files ending with '.yoad' from directory dname.
+    Binids, values and errors of all histograms in the yoda file fname.
     """
     import apprentice as app
-    import pathlib
+    import numpy as np
+    histos = app.io.read_histos(fname)
+    binids, Y, E = [], [], []
+    for refname in sorted(histos.keys()):
+        hname=refname.replace("/REF", "",1)
+        for num, b in enumerate(histos[refname]):
+            binids.append("{}#{}".format(hname, num))
+            Y.append(b[2])
+            E.append(b[3])
+    return np.array(binids, dtype=str), np.array(Y, dtype=np.float64), np.array(E, dtype=np.float64)
+
+def yodaDir2Dict(dname, cache=True):
+    """
+    Recursively find and read all files ending with '.yoda' from directory dname.
+    With cache, the parsed values are stored on disk (see yodaCacheName) and
+    only files whose path, size or mtime changed since are read again.
+    """
+    import numpy as np
+    import pathlib, os
+    files = [str(f.resolve()) for f in pathlib.Path(dname).rglob('*.yoda')]
+    stats = [os.stat(f) for f in files]
+
+    cached = {}
+    cname = yodaCacheName(dname)
+    if cache and os.path.exists(cname):
+        try:
+            with np.load(cname, allow_pickle=False) as C:
+                for f, size, mtime, a, b in zip(C["files"], C["sizes"], C["mtimes"], C["fstart"], C["fstop"]):
+                    cached[(str(f), int(size), int(mtime))] = (C["binids"][a:b], C["values"][a:b], C["errors"][a:b])
+        except Exception as e:
+            print("Ignoring unreadable cache {}: {}".format(cname, e))
+            cached = {}
+
+    parsed, changed = [], False
+    for f, st in zip(files, stats):
+        key = (f, st.st_size, st.st_mtime_ns)
+        if key not in cached:
+            cached[key] = yodaFile2Arrays(f)
+            changed = True
+        parsed.append(cached[key])
+
+    if cache and (changed or len(cached) != len(files)):
+        try:
+            os.makedirs(os.path.dirname(cname), exist_ok=True)
+            lens = np.array([len(p[0]) for p in parsed], dtype=np.int64)
+            fstop = np.cumsum(lens)
+            # Write to a temporary file first so concurrent readers never see a partial cache
+            tmp = "{}.{}.npz".format(cname[:-4], os.getpid())
+            np.savez(tmp, files=np.array(files, dtype=str),
+                    sizes =np.array([st.st_size     for st in stats], dtype=np.int64),
+                    mtimes=np.array([st.st_mtime_ns for st in stats], dtype=np.int64),
+                    fstart=fstop-lens, fstop=fstop,
+                    binids=np.concatenate([p[0] for p in parsed]) if parsed else np.array([], dtype=str),
+                    values=np.concatenate([p[1] for p in parsed]) if parsed else np.array([]),
+                    errors=np.concatenate([p[2] for p in parsed]) if parsed else np.array([]))
+            os.replace(tmp, cname)
+        except Exception as e:
+            print("Unable to write cache {}: {}".format(cname, e))
+
     bindict = {}
-    for f in pathlib.Path(dname).rglob('*.yoda'):
-        histos = app.io.read_histos(str(f.resolve()))
-        for refname in sorted(histos.keys()):
-            bins = histos[refname]
-            hname=refname.replace("/REF", "",1)
-            for num, b in enumerate(bins):
-                binid="{}#{}".format(hname, num)
-                bindict[binid]=(b[2], b[3])
+    for binids, Y, E in parsed:
+        for b, y, e in zip(binids.tolist(), Y.tolist(), E.tolist()): bindict[b]=(y, e)
     return bindict
 
 # TODO add binwidth in data model?
@@ -433,17 +714,282 @@ def readTuneResult(fname):
     with open(fname) as f:
         return json.load(f)
 
-def readApprox(fname, set_structures=True, usethese=None):
-    import json, apprentice
+def mkApprox(d, set_structures=True):
+    """
+    Approximation object from its dictionary representation.
+    """
+    import apprentice
+    if "n" in d: return apprentice.RationalApproximation(initDict=d) # FIXME what about set_structures for rationals?
+    else:        return apprentice.PolynomialApproximation(initDict=d, set_structures=set_structures)
+
+def readApproxDict(fname):
+    """
+    The dictionary binid -> approximation dictionary stored in the JSON file fname.
+    If fname is a directory, all shards (*.jsonl, one [binid, dict, [xmin, xmax]] per line)
+    in it are read, c.f. app-build --shards, their bin edges go into __xmin and __xmax
+    like in a single file.
+    """
+    import json, os
+    if os.path.isdir(fname):
+        rd, edges = {}, {}
+        for shard in sorted(listdir(fname)):
+            if not shard.endswith(".jsonl"): continue
+            with open(shard) as f:
+                for l in f:
+                    if len(l.strip()) == 0: continue
+                    L = json.loads(l)
+                    rd[L[0]] = L[1]
+                    edges[L[0]] = L[2] if len(L) > 2 else (L[1].get("xmin"), L[1].get("xmax"))
+        rd["__xmin"] = [edges[b][0] for b in rd.keys() if not b.startswith("__")]
+        rd["__xmax"] = [edges[b][1] for b in rd.keys() if not b.startswith("__")]
+        return rd
     with open(fname) as f:
-        rd = json.load(f)
-    binids = app.tools.sorted_nicely(rd.keys())
-    binids = [x for x in binids if not x.startswith("__")]
+        return json.load(f)
+
+def mergeApproxShards(dname, fout):
+    """
+    Merge the shards in directory dname into a single approximation file
+    fout --- a HDF5 container if fout ends with .h5 or .hdf5, JSON otherwise.
+    """
+    import json
+    rd = readApproxDict(dname)
+    edges = approxEdges(rd)
+    binids = sortBinids([b for b in rd.keys() if not b.startswith("__")])
+    if fout.endswith((".h5", ".hdf5")):
+        writeApproxH5(fout, binids, [mkApprox(rd[b]) for b in binids], xmin=[edges[b][0] for b in binids], xmax=[edges[b][1] for b in binids])
+    else:
+        from collections import OrderedDict
+        JD = OrderedDict([(b, rd[b]) for b in binids])
+        JD["__xmin"] = [edges[b][0] for b in binids]
+        JD["__xmax"] = [edges[b][1] for b in binids]
+        with open(fout, "w") as f: json.dump(JD, f, indent=4)
+
+def openCheckpoint(dname, rank=0):
+    """
+    The checkpoint file of rank in directory dname, opened for appending. A line
+    cut off by an earlier run that was killed is terminated first.
+    """
+    import os
+    fname = os.path.join(dname, "approx_{}.ckpt".format(rank))
+    f = open(fname, "a")
+    if f.tell() > 0:
+        with open(fname, "rb") as g:
+            g.seek(-1, os.SEEK_END)
+            if g.read(1) != b"\n": f.write("\n")
+    return f
+
+def writeCheckpoint(f, binid, d, edges, dt, meta):
+    """
+    Append a finished bin --- approximation dictionary d, bin edges, fit time dt and
+    the settings meta it was built with --- as one JSON line to the open file f.
+    """
+    import json
+    f.write(json.dumps([binid, d, [float(x) for x in edges], dt, meta]) + "\n")
+    f.flush()
+
+def readCheckpoint(dname, meta=None):
+    """
+    The dictionary binid -> (approximation dictionary, bin edges, fit time) of all
+    checkpoint files (*.ckpt, c.f. writeCheckpoint) in directory dname. Only bins
+    built with the settings meta are used if given. Incomplete lines, e.g. of a
+    run killed while writing, are ignored.
+    """
+    import json, os
+    done = {}
+    if not os.path.isdir(dname): return done
+    for ckpt in sorted(listdir(dname)):
+        if not ckpt.endswith(".ckpt"): continue
+        with open(ckpt) as f:
+            for l in f:
+                try:
+                    b, d, edges, dt, m = json.loads(l)
+                except ValueError:
+                    continue
+                if meta is not None and m != meta: continue
+                done[b] = (d, edges, dt)
+    return done
+
+def approxEdges(rd):
+    """
+    The dictionary binid -> (xmin, xmax) of the bin edges in __xmin and __xmax
+    of the approximation dictionary rd (c.f. readApproxDict), None where unknown.
+    """
+    binids = [b for b in rd.keys() if not b.startswith("__")]
+    if "__xmin" not in rd or "__xmax" not in rd: return dict([(b, (None, None)) for b in binids])
+    return dict(zip(binids, zip(rd["__xmin"], rd["__xmax"])))
+
+def sortBinids(binids):
+    """
+    Same ordering as app.tools.sorted_nicely for binids of the form "obs#num"
+    but the regular expression is only evaluated once per observable.
+    """
+    hb = [b.rsplit("#", 1) for b in binids]
+    if not all([len(x) == 2 and x[1].isdigit() for x in hb]): return app.tools.sorted_nicely(binids)
+    okey = {h[:-1]: num for num, h in enumerate(app.tools.sorted_nicely(list(set([x[0] + "#" for x in hb]))))}
+    return [b for _, _, b in sorted([(okey[h], int(n), b) for (h, n), b in zip(hb, binids)])]
+
+def readApproxJSON(fname, usethese=None, observables=None):
+    """
+    Read a JSON approximation file (or directory of shards) straight into
+    coefficient blocks --- same return values as readApproxH5, no per bin
+    objects are created. Bins not in usethese (binids) or whose observable is
+    not in observables are dropped before anything else is done.
+    The per bin array samescaler flags bins whose scaler is the one returned.
+    """
+    import numpy as np
+    import apprentice
+    rd = readApproxDict(fname)
+    binids = [b for b in rd.keys() if not b.startswith("__")]
     if usethese is not None:
-        binids = [x for x in binids if x in usethese]
+        keep = set(usethese)
+        binids = [b for b in binids if b in keep]
+    if observables is not None:
+        keep = set(observables)
+        binids = [b for b in binids if b.split("#")[0] in keep]
+    binids = sortBinids(binids)
+    D = [rd[b] for b in binids]
+    edges = approxEdges(rd)
+    del rd
+
+    info = {}
+    info["m"] = np.array([d["m"]        for d in D], dtype=np.int64)
+    info["n"] = np.array([d.get("n", 0) for d in D], dtype=np.int64)
+    for name in ["vmin", "vmax", "xmin", "xmax"]:
+        info[name] = np.array([d.get(name) if d.get(name) is not None else np.nan for d in D], dtype=np.float64)
+    # Rational approximations carry their bin edges only in __xmin and __xmax
+    for num, name in enumerate(["xmin", "xmax"]):
+        info[name] = np.array([x if not np.isnan(x) or edges[b][num] is None else edges[b][num] for b, x in zip(binids, info[name])], dtype=np.float64)
+
+    # Interned scalers, compatible ones are mostly identical
+    S = [apprentice.scaler.internScaler(d["scaler"]) for d in D]
+    info["samescaler"] = np.array([s is S[0] or s == S[0] for s in S])
+
+    groups = {}
+    for num, d in enumerate(D): groups.setdefault((d["m"], d.get("n", 0), "n" in d), []).append(num)
+    blocks = []
+    for (m, n, isRational), idx in sorted(groups.items()):
+        PC = np.array([D[i]["pcoeff"] for i in idx], dtype=np.float64)
+        QC = np.array([D[i]["qcoeff"] for i in idx], dtype=np.float64) if isRational else None
+        blocks.append((np.array(idx), m, n, PC, QC))
+    return binids, S[0], info, blocks
+
+def writePoles(fname, binids, qmin, pole, fout=None):
+    """
+    Store the per bin results of AppSet.screenPoles in the approximation file
+    fname (or a copy fout of it) --- as datasets qmin and pole in a HDF5 container,
+    as entries "qmin" and "pole" of the rational bins in a JSON file.
+    """
+    import numpy as np
+    import h5py, json
+    if fout is None: fout = fname
+    if h5py.is_hdf5(fname):
+        if fout != fname:
+            import shutil
+            shutil.copyfile(fname, fout)
+        with h5py.File(fout, "a") as f:
+            pos = dict([(b, num) for num, b in enumerate(np.char.decode(f["binids"][()], encoding='utf8'))])
+            idx = np.array([pos[b] for b in binids], dtype=np.int64)
+            Q, P = np.full(len(pos), np.nan), np.zeros(len(pos), dtype=bool)
+            Q[idx], P[idx] = qmin, pole
+            for name, V in [("qmin", Q), ("pole", P)]:
+                if name in f: del f[name]
+                f.create_dataset(name, data=V)
+    else:
+        import os
+        if os.path.isdir(fname) and fout == fname:
+            raise Exception("Cannot write pole information into the shards in {}, specify an output file".format(fname))
+        rd = readApproxDict(fname)
+        for b, q, p in zip(binids, qmin, pole):
+            if np.isnan(q): continue
+            rd[b]["qmin"] = float(q)
+            rd[b]["pole"] = bool(p)
+        with open(fout, "w") as f: json.dump(rd, f, indent=4)
 
-    APP = {}
-    for b in binids:
-        if "n" in rd[b]: APP[b] = apprentice.RationalApproximation(initDict=rd[b]) # FIXME what about set_structures for rationals?
-        else:            APP[b] = apprentice.PolynomialApproximation(initDict=rd[b], set_structures=set_structures)
-    return binids, [APP[b] for b in binids]
+def readApprox(fname, set_structures=True, usethese=None):
+    rd = readApproxDict(fname)
+    binids = [x for x in rd.keys() if not x.startswith("__")]
+    if usethese is not None:
+        keep = set(usethese)
+        binids = [x for x in binids if x in keep]
+    binids = sortBinids(binids)
+    return binids, [mkApprox(rd[b], set_structures) for b in binids]
+
+def h5memmap(fname, dset):
+    """
+    Memory map the HDF5 dataset dset of file fname. Only contiguous,
+    uncompressed datasets can be mapped, anything else is read into memory.
+    """
+    import numpy as np
+    offset = dset.id.get_offset()
+    if offset is None or dset.chunks is not None or dset.compression is not None:
+        return dset[()]
+    return np.memmap(fname, dtype=dset.dtype, mode="r", offset=offset, shape=dset.shape).view(np.ndarray)
+
+def writeApproxH5(fname, binids, RA, xmin=None, xmax=None):
+    """
+    Write the approximations RA for bins binids into a HDF5 container.
+    The coefficients are stored in blocks of equal order and type
+    (c.f. AppSet), the per bin information (orders, vmin, vmax, xmin, xmax)
+    as flat arrays --- all of them contiguous so readApproxH5 can memory map them.
+    There is only one scaler per container, approximations with a different one
+    are re-expressed in the most common one, c.f. AppSet.unifyScaler.
+    The bin edges xmin and xmax, if given, take precedence over those of RA.
+    """
+    import h5py, json
+    import numpy as np
+    import apprentice
+    AS = apprentice.appset.AppSet(RA, binids)
+    AS.unifyScaler()
+    if xmin is not None: AS._xmin = np.array(xmin, dtype=np.float64)
+    if xmax is not None: AS._xmax = np.array(xmax, dtype=np.float64)
+
+    with h5py.File(fname, "w") as f:
+        f.attrs["scaler"] = json.dumps(AS._SCLR.asDict)
+        f.create_dataset("binids", data=np.char.encode(np.array(AS._binids, dtype=str), encoding='utf8'))
+        for name in ["m", "n", "vmin", "vmax", "xmin", "xmax"]:
+            f.create_dataset(name, data=getattr(AS, "_"+name))
+        for num, B in enumerate(AS._blocks):
+            g = f.create_group("blocks/{}".format(num))
+            g.attrs["m"] = B.m
+            g.attrs["n"] = B.n
+            g.attrs["rational"] = B.isRational
+            g.create_dataset("idx", data=B.idx)
+            g.create_dataset("PC",  data=B.PC)
+            if B.isRational: g.create_dataset("QC", data=B.QC)
+
+def readApproxH5(fname, usethese=None, observables=None):
+    """
+    Read a container written by writeApproxH5 without constructing any
+    per bin objects. Returns binids, the scaler, a dict of the per bin arrays and
+    a list of blocks (idx, m, n, PC, QC) --- the coefficient arrays are memory mapped
+    unless a subset of bins is requested via usethese (binids) or observables.
+    """
+    import h5py, json
+    import numpy as np
+    import apprentice
+    with h5py.File(fname, "r") as f:
+        SCLR   = apprentice.scaler.internScaler(json.loads(f.attrs["scaler"]))
+        binids = np.char.decode(f["binids"][()], encoding='utf8')
+        info   = dict([(name, h5memmap(fname, f[name])) for name in ["m", "n", "vmin", "vmax", "xmin", "xmax"]])
+        blocks = []
+        for num in range(len(f["blocks"])):
+            g = f["blocks/{}".format(num)]
+            blocks.append((g["idx"][()], int(g.attrs["m"]), int(g.attrs["n"]),
+                h5memmap(fname, g["PC"]), h5memmap(fname, g["QC"]) if g.attrs["rational"] else None))
+
+    if usethese is not None or observables is not None:
+        keep = np.ones(len(binids), dtype=bool)
+        if usethese    is not None: keep &= np.isin(binids, list(usethese))
+        if observables is not None: keep &= np.isin(np.array([b.split("#")[0] for b in binids]), list(observables))
+        keep = np.where(keep)[0]
+        newpos = np.full(len(binids), -1, dtype=np.int64)
+        newpos[keep] = np.arange(len(keep))
+        binids = binids[keep]
+        info = dict([(k, v[keep]) for k, v in info.items()])
+        _blocks = []
+        for idx, m, n, PC, QC in blocks:
+            rows = np.where(newpos[idx] >= 0)[0]
+            if len(rows) == 0: continue
+            _blocks.append((newpos[idx[rows]], m, n, PC[rows], QC[rows] if QC is not None else None))
+        blocks = _blocks
+    return list(binids), SCLR, info, blocks
@@ -67,6 +67,114 @@ def recurrence(X, structure):
     return np.prod(X**structure, axis=1, dtype=np.float64)
 
 
+@lru_cache(maxsize=32)
+def monomialParents(dim, order):
+    """
+    For every monomial of monomialStructure(dim, order) the index of its parent
+    monomial and the coordinate the parent needs to be multiplied with, i.e.
+    monomial[j] = monomial[parent[j]] * x[coord[j]].
+    Graded-lex order guarantees that parent[j] < j.
+    """
+    S = monomialStructure(dim, order).reshape((-1, dim))
+    lookup = {tuple(s): num for num, s in enumerate(S)}
+    parent = np.zeros(len(S), dtype=np.int64)
+    coord  = np.zeros(len(S), dtype=np.int64)
+    for num, s in enumerate(S[1:], 1):
+        c = np.nonzero(s)[0][-1]
+        t = s.copy()
+        t[c] -= 1
+        parent[num] = lookup[tuple(t)]
+        coord[num]  = c
+    return parent, coord
+
+@lru_cache(maxsize=32)
+def monomialDerivatives(dim, order):
+    """
+    The partial derivatives of the monomials of monomialStructure(dim, order)
+    in terms of the same monomials, d monomial[j]/d x[c] = factor[c, j] * monomial[lower[c, j]].
+    Returns lower and factor, both of shape (dim, number of monomials), where
+    monomial[j] does not depend on x[c] factor[c, j] is 0 (and lower[c, j] is 0).
+    """
+    S = monomialStructure(dim, order).reshape((-1, dim))
+    lookup = {tuple(s): num for num, s in enumerate(S)}
+    lower  = np.zeros((dim, len(S)), dtype=np.int64)
+    factor = np.array(S.T, dtype=np.float64)
+    for num, s in enumerate(S):
+        for c in np.nonzero(s)[0]:
+            t = s.copy()
+            t[c] -= 1
+            lower[c, num] = lookup[tuple(t)]
+    return lower, factor
+
+@njit
+def recurrenceParents(x, parent, coord):
+    """
+    The recurrence at point x from graded-lex parent products, one
+    multiplication per monomial --- see monomialParents.
+    """
+    rec = np.empty(len(parent), dtype=np.float64)
+    rec[0] = 1.
+    for j in range(1, len(parent)):
+        rec[j] = rec[parent[j]] * x[coord[j]]
+    return rec
+
+@njit
+def recurrenceParentsMany(X, parent, coord):
+    """
+    The recurrence for many points X (shape (npoints, dim)) from graded-lex parent
+    products --- returns an array of shape (len(parent), npoints).
+    """
+    REC = np.empty((len(parent), X.shape[0]), dtype=np.float64)
+    REC[0] = 1.
+    for j in range(1, len(parent)):
+        for p in range(X.shape[0]):
+            REC[j, p] = REC[parent[j], p] * X[p, coord[j]]
+    return REC
+
+@njit
+def powerTable(x, order):
+    """
+    Table of shape (dim, order+1) with entry [i, k] being x[i]**k,
+    built by repeated multiplication.
+    """
+    PT = np.empty((len(x), order + 1), dtype=np.float64)
+    for i in range(len(x)):
+        PT[i, 0] = 1.
+        for k in range(1, order + 1):
+            PT[i, k] = PT[i, k-1] * x[i]
+    return PT
+
+@lru_cache(maxsize=32)
+def affineTerms(dim, order):
+    """
+    The expansion of all monomials x^s of monomialStructure(dim, order) with x = alpha*y + beta,
+    i.e. x^s = sum_k binom(s, k) alpha^k beta^(s-k) y^k over all k <= s.
+    Returns, per term, the indices of x^s and y^k, binom(s, k), k and s-k.
+    """
+    import itertools
+    from scipy.special import comb
+    S = monomialStructure(dim, order).reshape((-1, dim))
+    lookup = {tuple(s): num for num, s in enumerate(S)}
+    src, dst, K = [], [], []
+    for num, s in enumerate(S):
+        for k in itertools.product(*[range(e+1) for e in s]):
+            src.append(num)
+            dst.append(lookup[k])
+            K.append(k)
+    src, dst, K = np.array(src), np.array(dst), np.array(K).reshape((-1, dim))
+    return src, dst, np.prod(comb(S[src], K), axis=1), K, S[src] - K
+
+def affineSubstitution(coeff, dim, order, alpha, beta):
+    """
+    Coefficients of the polynomial y -> p(alpha*y + beta) (alpha, beta per coordinate)
+    where p has coefficients coeff and structure monomialStructure(dim, order).
+    """
+    src, dst, BIN, K, L = affineTerms(dim, order)
+    W = BIN * np.prod(np.power(alpha, K) * np.power(beta, L), axis=1)
+    out = np.zeros(len(coeff), dtype=np.float64)
+    np.add.at(out, dst, W * np.array(coeff, dtype=np.float64)[src])
+    return out
+
 def recurrence2(X, structure, nnz):
     temp = np.ones((len(structure), len(X)))
     np.power(X, structure, where=nnz, out=(temp))
@@ -93,5 +201,26 @@ def vandermonde(params, order):
         np.power(params, s[:, np.newaxis], out=(V), where=s[:, np.newaxis]>0)
         return np.prod(V, axis=2).T
 
+from collections import OrderedDict
+_DESIGNCACHE = OrderedDict()
+DESIGNCACHESIZE = 32
+
+def designMatrix(XS, order):
+    """
+    Cached vandermonde(XS, order) for scaled points XS. Bins fitted on the same
+    points (i.e. with the same sample mask) share the matrix --- the least recently
+    used of at most DESIGNCACHESIZE matrices is dropped. The returned array is read-only.
+    """
+    XS = np.ascontiguousarray(XS, dtype=np.float64)
+    key = (XS.shape, XS.tobytes(), order)
+    if key in _DESIGNCACHE:
+        _DESIGNCACHE.move_to_end(key)
+        return _DESIGNCACHE[key]
+    V = vandermonde(XS, order)
+    V.setflags(write=False)
+    _DESIGNCACHE[key] = V
+    while len(_DESIGNCACHE) > DESIGNCACHESIZE: _DESIGNCACHE.popitem(last=False)
+    return V
+
 if __name__=="__main__":
     print(monomialStructure(2,3))
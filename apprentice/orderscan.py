@@ -0,0 +1,78 @@
+import numpy as np
+import apprentice
+
+class OrderScan(object):
+    def __init__(self, X, Y, mmax, nmax=0, scale_min=-1, scale_max=1, pnames=None):
+        """
+        Least squares fits of all orders (m, n) with m <= mmax and n <= nmax
+        on the same points, polynomials (n=0) or linearised rationals
+        (c.f. RationalApproximation strategy=2).
+
+        The graded-lex design matrix of order m is a column prefix of the one
+        of order mmax. Per denominator order n, the columns
+        [-Y*VN_n (without the constant), VM_mmax] are QR factorised once
+        (no pivoting) and the fits of all m are read off the leading blocks.
+
+            X     --- anchor points
+            Y     --- function values
+        """
+        self._scaler = apprentice.Scaler(np.atleast_2d(np.array(X, dtype=np.float64)), a=scale_min, b=scale_max, pnames=pnames)
+        self._X    = self._scaler.scaledPoints
+        self._dim  = self._X[0].shape[0]
+        self._Y    = np.array(Y, dtype=np.float64)
+        self._mmax = mmax
+        self._nmax = nmax
+        self._V    = apprentice.monomial.designMatrix(self._X, max(mmax, nmax))
+        self._YY   = self._Y.dot(self._Y)
+        self._QR   = {}
+
+    @property
+    def dim(self): return self._dim
+    @property
+    def trainingsize(self): return len(self._Y)
+
+    def factorisation(self, n):
+        """
+        R and Q^T Y of the design matrix for denominator order n, computed once.
+        """
+        if n not in self._QR:
+            from apprentice import tools
+            M = tools.numCoeffsPoly(self.dim, self._mmax)
+            N = tools.numCoeffsPoly(self.dim, n)
+            A = np.hstack([-self._V[:, 1:N] * self._Y[:, np.newaxis], self._V[:, :M], self._Y[:, np.newaxis]])
+            # Q is never formed, the last column of R of [A, Y] is Q^T Y
+            R = np.linalg.qr(A, mode="r")
+            K = A.shape[1] - 1
+            self._QR[n] = (R[:K, :K], R[:K, K])
+        return self._QR[n]
+
+    def solve(self, m, n=0):
+        """
+        Numerator and denominator coefficients (None for n=0) of order (m, n)
+        and the residual sum of squares of the (linearised) least squares problem.
+        """
+        if m > self._mmax or n > self._nmax:
+            raise Exception("Order ({},{}) exceeds the scan up to ({},{})".format(m, n, self._mmax, self._nmax))
+        from apprentice import tools
+        from scipy.linalg import solve_triangular
+        M = tools.numCoeffsPoly(self.dim, m)
+        N = tools.numCoeffsPoly(self.dim, n)
+        k = N - 1 + M
+        if k > self.trainingsize:
+            raise Exception("Not enough inputs: got %i but require %i to do m=%i n=%i"%(self.trainingsize, k, m, n))
+        R, QTY = self.factorisation(n)
+        x = solve_triangular(R[:k, :k], QTY[:k])
+        res = max(0., self._YY - QTY[:k].dot(QTY[:k]))
+        if n == 0: return x, None, res
+        return x[N-1:], np.concatenate([[1], x[:N-1]]), res
+
+    def approximation(self, m, n=0):
+        """
+        The PolynomialApproximation (n=0) or RationalApproximation of order (m, n).
+        """
+        pcoeff, qcoeff, res = self.solve(m, n)
+        d = {"dim": self.dim, "trainingsize": self.trainingsize, "m": m, "pcoeff": list(pcoeff), "scaler": self._scaler.asDict}
+        if n == 0: return apprentice.PolynomialApproximation(initDict=d)
+        d["n"] = n
+        d["qcoeff"] = list(qcoeff)
+        return apprentice.RationalApproximation(initDict=d)
@@ -110,7 +110,7 @@ class PolynomialApproximation(BaseEstimator, RegressorMixin):
         self.setStructures()
 
         from apprentice import monomial
-        VM = monomial.vandermonde(self._X, self.m)
+        VM = monomial.designMatrix(self._X, self.m)
         strategy=kwargs["strategy"] if kwargs.get("strategy") is not None else 1
         if kwargs.get("computecov") is not False:
             self._cov = np.linalg.inv(2*VM.T@VM)
@@ -194,7 +194,7 @@ class PolynomialApproximation(BaseEstimator, RegressorMixin):
         self._pcoeff     = np.array(pdict["pcoeff"])
         self._m = int(pdict["m"])
         self._dim=int(pdict["dim"])
-        self._scaler = apprentice.Scaler(pdict["scaler"])
+        self._scaler = apprentice.scaler.internScaler(pdict["scaler"])
         if self._dim==1: self.recurrence=apprentice.monomial.recurrence1D
         else           : self.recurrence=apprentice.monomial.recurrence
         if "vmin" in pdict: self._vmin = pdict["vmin"]
@@ -287,6 +287,33 @@ class PolynomialApproximation(BaseEstimator, RegressorMixin):
         return dec
 
 
+def batchFit(DATA, order, pnames=None, scale_min=-1, scale_max=1):
+    """
+    Polynomial approximations of order for many data sets DATA = [(X1, Y1), (X2, Y2), ...].
+    Data sets with identical anchor points X (e.g. bins read with readH5 sharing the
+    same NaN/inf filtering) share one Scaler and Vandermonde matrix and are solved
+    together as a single multi right hand side least squares problem.
+    Returns a list of PolynomialApproximation, None where there are not enough points.
+    """
+    from apprentice import tools, monomial
+    groups = {}
+    for num, (X, Y) in enumerate(DATA):
+        X = np.atleast_2d(np.array(X, dtype=np.float64))
+        groups.setdefault((X.shape, X.tobytes()), (X, []))[1].append(num)
+
+    ret = [None for _ in DATA]
+    for X, nums in groups.values():
+        if X.size == 0 or len(X) < tools.numCoeffsPoly(X.shape[1], order): continue
+        SCLR = apprentice.Scaler(X, a=scale_min, b=scale_max, pnames=pnames)
+        VM   = monomial.vandermonde(SCLR.scaledPoints, order)
+        Y    = np.array([DATA[num][1] for num in nums], dtype=np.float64).T
+        rcond = -1 if np.version.version < "1.15" else None
+        PC, res, rank, s = np.linalg.lstsq(VM, Y, rcond=rcond)
+        sdict = SCLR.asDict
+        for num, pc in zip(nums, PC.T):
+            ret[num] = PolynomialApproximation(initDict={"dim": X.shape[1], "m": order, "pcoeff": pc, "scaler": sdict, "trainingsize": len(X)})
+    return ret
+
 
 if __name__=="__main__":
 
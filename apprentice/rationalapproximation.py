@@ -87,14 +87,14 @@ class RationalApproximation(BaseEstimator, RegressorMixin):
         This does the solving for the numerator and denominator coefficients
         following Anthony's recipe.
         """
-        Fmatrix=np.diag(self._Y)
+        # diag(Y) VN as a row scaling, never form the N x N diag(Y)
+        FVN = VN * self._Y[:, np.newaxis]
         # rcond changes from 1.13 to 1.14
         rcond = -1 if np.version.version < "1.15" else None
-        # Solve VM x = diag(Y)
-        MM, res, rank, s  = np.linalg.lstsq(VM, Fmatrix, rcond=rcond)
-        Zmatrix = MM.dot(VN)
+        # Solve VM Z = diag(Y) VN
+        Zmatrix, res, rank, s  = np.linalg.lstsq(VM, FVN, rcond=rcond)
         # Solve (VM Z - F VN)x = 0
-        U, S, Vh = np.linalg.svd(VM.dot(Zmatrix) - Fmatrix.dot(VN))
+        U, S, Vh = np.linalg.svd(VM.dot(Zmatrix) - FVN, full_matrices=False)
         self._qcoeff = Vh[-1] # The column of (i.e. row of Vh) corresponding to the smallest singular value is the least squares solution
         self._pcoeff = Zmatrix.dot(self._qcoeff)
 
@@ -110,7 +110,7 @@ class RationalApproximation(BaseEstimator, RegressorMixin):
         """
         FQ = - (VN.T * self._Y).T # This is something like -F*q
         A = np.hstack([VM, FQ[:,1:]]) # Note that we leave the b0 terms out when defining A
-        U, S, Vh = np.linalg.svd(A)
+        U, S, Vh = np.linalg.svd(A, full_matrices=False) # thin SVD, U is N x (M+N_q-1)
         # Given A = U Sigma VT, for A x = b, it follows, that: x = V Sigma^-1 UT b
         # b really is b0 * F but we explicitly choose b0 to be 1
         # The solution formula is taken from numerical recipes
@@ -130,7 +130,7 @@ class RationalApproximation(BaseEstimator, RegressorMixin):
         """
         FQ = - (VN.T * self._Y).T
         A = np.hstack([VM, FQ])
-        U, S, Vh = np.linalg.svd(A)
+        U, S, Vh = np.linalg.svd(A, full_matrices=False)
         self._pcoeff = Vh[-1][:self._M]
         self._qcoeff = Vh[-1][self._M:]
 
@@ -147,8 +147,8 @@ class RationalApproximation(BaseEstimator, RegressorMixin):
         self.setStructures()
 
         from apprentice import monomial
-        VM = monomial.vandermonde(self._X, self._m)
-        VN = monomial.vandermonde(self._X, self._n)
+        VM = monomial.designMatrix(self._X, self._m)
+        VN = monomial.designMatrix(self._X, self._n)
         strategy=kwargs["strategy"] if kwargs.get("strategy") is not None else 1
         if   strategy==1: self.coeffSolve( VM, VN)
         elif strategy==2: self.coeffSolve2(VM, VN)
@@ -251,7 +251,7 @@ class RationalApproximation(BaseEstimator, RegressorMixin):
         self._m      = int(pdict["m"])
         self._n      = int(pdict["n"])
         self._dim    = int(pdict["dim"])
-        self._scaler = apprentice.Scaler(pdict["scaler"])
+        self._scaler = apprentice.scaler.internScaler(pdict["scaler"])
         if "vmin" in pdict: self._vmin = pdict["vmin"]
         if "vmax" in pdict: self._vmax = pdict["vmax"]
         if self._dim==1: self.recurrence=apprentice.monomial.recurrence1D
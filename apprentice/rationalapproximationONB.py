@@ -63,7 +63,7 @@ class RationalApproximationONB(object):
         self._qcoeff = np.array(RDict["qcoeff"])
         self._m = int(RDict["m"])
         self._n = int(RDict["n"])
-        self._scaler = apprentice.Scaler(RDict["scaler"])
+        self._scaler = apprentice.scaler.internScaler(RDict["scaler"])
         self._ONB = apprentice.ONB(RDict["ONB"])
 
     def mkFromJSON(self, fname):
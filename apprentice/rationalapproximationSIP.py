@@ -138,6 +138,7 @@ class RationalApproximationSIP():
                                 msbarontime: multistart algorithm using scipy.L-BFGS-B local optimizer that restarts for the amount of time baron would run for the no. of nonlinearities
                                 baron: baron through pyomo (REQUIRED: Pyomo and baron executable in PATH)
                                 solve: solve q(x) at random points in the box of X
+                                batch: evaluate q(x) at quasi-random points in one go and polish the best few, c.f. tools.polyMinBox
                                 ss_ms_so_ba: runs single start, multistart, baron and solve, and logs the different objective function values obtained
                                 mlsl: multi-level single-linkage multistart algorithm from nlopt using nlopt.LD_LBFGS local optimizer
             localoptsolver  --- strategy to perform local optimization in robust optimization with single start and multistart approaches --- if omitted: auto 'scipy' used
@@ -216,7 +217,7 @@ class RationalApproximationSIP():
         self.mkFromDict(d)
 
     def mkFromDict(self, pdict):
-        self._scaler        = apprentice.Scaler(pdict["scaler"])
+        self._scaler        = apprentice.scaler.internScaler(pdict["scaler"])
         self._pcoeff        = np.array(pdict["pcoeff"])
         self._qcoeff        = np.array(pdict["qcoeff"])
         self._iterationinfo = pdict["iterationinfo"]
@@ -297,10 +298,12 @@ class RationalApproximationSIP():
         self._struct_p      = apprentice.monomialStructure(self.dim, self.m)
         self._struct_q      = apprentice.monomialStructure(self.dim, self.n)
 
+        VM = apprentice.monomial.designMatrix(self._X[:self.trainingsize], self.m)
+        VN = apprentice.monomial.designMatrix(self._X[:self.trainingsize], self.n)
         self._ipo            = np.empty((self.trainingsize,2), "object")
         for i in range(self.trainingsize):
-            self._ipo[i][0] = self.recurrence(self._X[i,:],self._struct_p)
-            self._ipo[i][1] = self.recurrence(self._X[i,:],self._struct_q)
+            self._ipo[i][0] = VM[i]
+            self._ipo[i][1] = VN[i]
         start = timer()
         self.fit()
         end = timer()
@@ -533,6 +536,10 @@ class RationalApproximationSIP():
                 self.printDebug("Starting ms")
                 x, robO, restartInfo = self.multipleRestartForIterRobO(coeffs,maxRestarts,threshold)
                 data['robOptInfo'] = {'robustArg':x.tolist(),'robustObj':robO,'info':restartInfo}
+            elif(self._roboptstrategy == 'batch'):
+                self.printDebug("Starting batch")
+                x, robO, restartInfo = self.batchRobO(coeffs)
+                data['robOptInfo'] = {'robustArg':x.tolist(),'robustObj':robO,'info':restartInfo}
             elif(self._roboptstrategy == 'mlsl'):
                 x, robO, restartInfo = self.mlslRobO(coeffs,threshold)
                 data['robOptInfo'] = {'robustArg':x.tolist(),'robustObj':robO,'info':restartInfo}
@@ -869,6 +876,12 @@ class RationalApproximationSIP():
         restartInfo.append({'log':{'time':totaltime, 'noRestarts':norestarts}})
         return minx, minrobO, restartInfo
 
+    def batchRobO(self, coeffs):
+        start = timer()
+        x, robO = tools.polyMinBox(coeffs[self.M:self.M+self.N], self.dim, self.n, self.box)
+        restartInfo = [{'robustArg':x.tolist(),'robustObj':robO, 'log':{'time':timer()-start}}]
+        return x, robO, restartInfo
+
     def restartRobO(self, coeffs, threshold, solver, r):
         x0 = []
         if(r == 0):
@@ -249,7 +249,7 @@ class RationalApproximationSIPONB():
         self.mkFromDict(d)
 
     def mkFromDict(self, pdict):
-        self._scaler        = apprentice.Scaler(pdict["scaler"])
+        self._scaler        = apprentice.scaler.internScaler(pdict["scaler"])
         self._pcoeff        = np.array(pdict["pcoeff"])
         self._qcoeff        = np.array(pdict["qcoeff"])
         self._iterationinfo = pdict["iterationinfo"]
@@ -45,12 +45,23 @@ class RationalApproximationSLSQP(apprentice.RationalApproximation):
                             --- order of the numerator polynomial --- if omitted: auto 1 used
                             --- order of the denominator polynomial --- if omitted: auto 1 used
             pnames          --- list of parameter names to pass to the scaler to scale
+            coeffs0         --- initial point (pcoeff, qcoeff concatenated) for the SLSQP fit,
+                                e.g. the solution of a neighbouring bin
+            restarts        --- maximum number of restarts of a failed SLSQP fit
+            roboptstrategy  --- strategy to optimize the robust objective min q(x) --- if omitted: auto 'ms' used
+                                ms: multistart algorithm using scipy.L-BFGS-B local optimizer
+                                batch: evaluate q at quasi-random points and the box corners in one go and
+                                       polish the best few, c.f. tools.polyMinBox, a minimum above threshold
+                                       is certified with tools.polyChangesSignBernstein
         """
         self._vmin=None
         self._vmax=None
         self._debug = kwargs["debug"] if kwargs.get("debug") is not None else  False
         self._ftol      = float(kwargs["ftol"])  if kwargs.get("ftol")    is not None else 1e-9
         self._slsqp_iter= int(kwargs["itslsqp"]) if kwargs.get("itslsqp") is not None else 200
+        self._restarts  = int(kwargs["restarts"]) if kwargs.get("restarts") is not None else 10
+        self._coeffs0   = kwargs.get("coeffs0")
+        self._roboptstrategy = kwargs["roboptstrategy"] if kwargs.get("roboptstrategy") is not None else "ms"
 
         self._m=kwargs["order"][0]
         self._n=kwargs["order"][1]
@@ -80,18 +91,15 @@ class RationalApproximationSLSQP(apprentice.RationalApproximation):
 
     def setIPO(self):
         """
-        Calculate the Pade approximation
+        Numerator and denominator recurrences at all training points,
+        shared among bins with the same points, c.f. monomial.designMatrix
         """
-        self._ipo            = np.empty((self.trainingsize,2), "object")
-        for i in range(self.trainingsize):
-            self._ipo[i][0] = self.recurrence(self._X[i,:],self._struct_p)
-            self._ipo[i][1] = self.recurrence(self._X[i,:],self._struct_q)
+        self._ipop = apprentice.monomial.designMatrix(self._X, self.m)
+        self._ipoq = apprentice.monomial.designMatrix(self._X, self.n)
 
     def scipyfit(self, coeffs0, cons, ftol=1e-9, iprint=2):
         start = timer()
-        ipop = np.array([self._ipo[i][0] for i in range(self.trainingsize)])
-        ipoq = np.array([self._ipo[i][1] for i in range(self.trainingsize)])
-        ret = minimize(fast_leastSqObj, coeffs0 , args=(self.trainingsize, ipop, ipoq, self.M, self.N, self._Y),
+        ret = minimize(fast_leastSqObj, coeffs0 , args=(self.trainingsize, self._ipop, self._ipoq, self.M, self.N, self._Y),
                 jac=fast_jac, method = 'SLSQP', constraints=cons,
                 options={'maxiter': self._slsqp_iter, 'ftol': self._ftol, 'disp': self._debug, 'iprint': iprint})
         end = timer()
@@ -101,35 +109,26 @@ class RationalApproximationSLSQP(apprentice.RationalApproximation):
     def fit(self, maxIterations=1000, maxRestarts=100, threshold=0.2):
 
 
-        ipoq = np.array([self._ipo[i][1] for i in range(self.trainingsize)])
+        ipoq = self._ipoq
         cons = np.empty(0, "object")
         cons = np.append(cons, {'type': 'ineq', 'fun':fast_robustSampleV, 'jac':fast_robustSampleG,  'args':(ipoq, self.M, self.N)})
 
-        # TODO need to check if this is a feasible point!
-        coeffs0 = np.ones((self.M+self.N))
-        coeffs0[self.M] = 2
+        coeffs0 = self.startPoint()
 
         self._iterationinfo = []
         for iter in range(1, maxIterations+1):
             data = {}
-            coeffs, leastSq, optstatus = self.scipyfit(coeffs0, cons, ftol=self._ftol)
-            # This is a bit brutal trial and error,
-            # if the starting point was not good, we just try again with a random
-            # vector, otherwise coeffs is always the same and this loop does nothing
-            # but waste time
-            if optstatus['status'] not in [0,9]:
-                fixme=True
-                while fixme:
-                    coeffs0 = np.random.random(coeffs0.shape)
-                    coeffs, leastSq, optstatus = self.scipyfit(coeffs0, cons)
-                    if optstatus['status']!=0:
-                        fixme=False
+            coeffs, leastSq, optstatus = self.boundedFit(coeffs0, cons)
+            # The next iteration only adds a constraint, start from this solution
+            coeffs0 = coeffs
 
             data['pcoeff'] = coeffs[0:self.M].tolist()
             data['qcoeff'] = coeffs[self.M:self.M+self.N].tolist()
 
             robO = 0
-            x, robO, restartInfo, newC, newO = self.multipleRestartForIterRobO(coeffs,maxRestarts,threshold)
+            if   self._roboptstrategy == "batch": x, robO, restartInfo = self.batchRobO(coeffs, maxRestarts, threshold)
+            elif self._roboptstrategy == "ms":    x, robO, restartInfo, newC, newO = self.multipleRestartForIterRobO(coeffs,maxRestarts,threshold)
+            else: raise Exception("rob opt strategy unknown")
             data['robOptInfo'] = {'robustArg':x.tolist(),'robustObj':robO,'info':restartInfo}
 
             self._iterationinfo.append(data)
@@ -148,6 +147,83 @@ class RationalApproximationSLSQP(apprentice.RationalApproximation):
         self._pcoeff = np.array(self._iterationinfo[len(self._iterationinfo)-1]["pcoeff"])
         self._qcoeff = np.array(self._iterationinfo[len(self._iterationinfo)-1]["qcoeff"])
 
+    def startPoint(self):
+        """
+        Initial point of the SLSQP fit, the warm start coeffs0 if given, else q=2.
+        As p/q is invariant under scaling, a warm start with a denominator of fixed
+        sign on the training points is rescaled to min q = 1, i.e. made feasible.
+        Only q is taken from the warm start, p is the linear least squares
+        solution of p = Y q for that q --- starting from a small objective with a
+        stale p makes SLSQP stop early because ftol is absolute.
+        """
+        if self._coeffs0 is None:
+            coeffs0 = np.ones((self.M+self.N))
+            coeffs0[self.M] = 2
+            return coeffs0
+
+        coeffs0 = np.array(self._coeffs0, dtype=np.float64)
+        if len(coeffs0) != self.M+self.N:
+            raise Exception("Warm start has {} coefficients but require {} for m={} n={}".format(len(coeffs0), self.M+self.N, self.m, self.n))
+        q = self._ipoq.dot(coeffs0[self.M:])
+        if np.all(q<0):
+            coeffs0, q = -coeffs0, -q
+        if np.all(q>0):
+            coeffs0, q = coeffs0/np.min(q), q/np.min(q)
+        rcond = -1 if np.version.version < "1.15" else None
+        coeffs0[:self.M] = np.linalg.lstsq(self._ipop, self._Y * q, rcond=rcond)[0]
+        return coeffs0
+
+    def boundedFit(self, coeffs0, cons):
+        """
+        SLSQP fit starting from coeffs0. A fit that fails is retried from the default
+        start and then from at most self._restarts random vectors. Returns the
+        first successful fit, or the one with the smallest objective.
+        """
+        default = np.ones(coeffs0.shape)
+        default[self.M] = 2
+        best = None
+        for i in range(self._restarts+2):
+            if   i==0: x0 = coeffs0
+            elif i==1:
+                if np.array_equal(coeffs0, default): continue
+                x0 = default
+            else:      x0 = np.random.random(coeffs0.shape)
+            coeffs, leastSq, optstatus = self.scipyfit(x0, cons, ftol=self._ftol)
+            if self._debug: print("SLSQP start {}: status {} after {} iterations".format(i, optstatus['status'], optstatus['noOfIterations']))
+            if optstatus['status'] in [0,9]:
+                return coeffs, leastSq, optstatus
+            if best is None or leastSq < best[1]:
+                best = (coeffs, leastSq, optstatus)
+        return best
+
+    def batchRobO(self, coeffs, maxRestarts=10, threshold=0.2, maxboxes=64, maxsize=2**16):
+        """
+        Minimum of the denominator over the box, c.f. tools.polyMinBox.
+        A minimum of at least threshold is only accepted if the Bernstein check finds
+        no sign change of q - threshold (c.f. tools.polyChangesSignBernstein), else the
+        witness point is returned. If the check is undecided or the Bernstein tensor
+        has more than maxsize entries, the multistart result is used if it is smaller.
+        """
+        start = timer()
+        x, robO = tools.polyMinBox(coeffs[self.M:], self.dim, self.n, self.box)
+        restartInfo = [{'robustArg':x.tolist(),'robustObj':robO, 'log':{'time':timer()-start}}]
+        if robO < threshold: return x, robO, restartInfo
+
+        bad = None
+        if (self.n+1)**self.dim <= maxsize:
+            qcoeff = np.array(coeffs[self.M:], dtype=np.float64)
+            qcoeff[0] -= threshold
+            bad, xmin, _ = tools.polyChangesSignBernstein(qcoeff, self._struct_q, self.box, maxboxes)
+        if bad:
+            x, robO = np.array(xmin), self.robustObj(xmin, coeffs)
+            restartInfo.append({'robustArg':x.tolist(),'robustObj':robO, 'log':{'time':timer()-start, 'bernstein':True}})
+        elif bad is None:
+            if self._debug: print("Bernstein check undecided, falling back to multistart")
+            xms, robOms, msInfo, _, _ = self.multipleRestartForIterRobO(coeffs, maxRestarts, threshold)
+            restartInfo.extend(msInfo)
+            if robOms < robO: x, robO = xms, robOms
+        return x, robO, restartInfo
+
     def multipleRestartForIterRobO(self, coeffs, maxRestarts=10, threshold=0.2, solver="L-BFGS-B"):
         minx, restartInfo = [], []
         totaltime, norestarts = 0, 0
@@ -175,7 +251,9 @@ class RationalApproximationSLSQP(apprentice.RationalApproximation):
 
     def restartRobO(self, x0, coeffs, threshold, solver):
         ret = minimize(self.robustObj, x0, bounds=self.box, args = (coeffs,), method = solver, options={'maxiter': 1000,'ftol': 1e-4, 'disp': False})
-        optstatus = {'message':ret.get('message').decode(), 'status':ret.get('status'), 'noOfIterations':ret.get('nit'), 'time':0}
+        msg = ret.get('message')
+        if isinstance(msg, bytes): msg = msg.decode()
+        optstatus = {'message':msg, 'status':ret.get('status'), 'noOfIterations':ret.get('nit'), 'time':0}
         return ret.x, ret.fun, optstatus
 
 
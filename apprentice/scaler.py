@@ -199,6 +199,22 @@ class Scaler(object):
         return (self.dim == other.dim) and np.all(np.isclose(self._a, other._a)) and np.all(np.isclose(self._scaleTerm, other._scaleTerm)) and np.all(np.isclose(self._Xmin, other._Xmin))
 
 
+import weakref
+_INTERNED = weakref.WeakValueDictionary()
+def internScaler(ScalerDict, digits=10):
+    """
+    The Scaler for ScalerDict (c.f. Scaler.asDict), shared among all
+    dictionaries describing the same box up to rounding to digits significant
+    digits --- scalers obtained this way can mostly be compared by identity.
+    As in Scaler.__eq__ the parameter names are not compared, all bins of a
+    file have the same ones. Scalers no longer in use are dropped from the cache.
+    """
+    key = tuple(tuple(float("{:.{}g}".format(x, digits)) for x in ScalerDict[k]) for k in ["a", "b", "Xmin", "Xmax"])
+    SCLR = _INTERNED.get(key)
+    if SCLR is None:
+        SCLR = Scaler(ScalerDict)
+        _INTERNED[key] = SCLR
+    return SCLR
 
 if __name__== "__main__":
     D=np.array([[1.,2.,3.],[4.,5.,6.],[7.,8.,9.],[1,4,7],[5,3,9]])
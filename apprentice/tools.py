@@ -59,8 +59,94 @@ def denomChangesSignMS(rapp, multistart=10):
     if bad: return True,  xmin, xmax
     else:   return False, xmin, xmax
 
+def bernsteinCoefficients(coeff, struct, box):
+    """
+    Tensor of the Bernstein coefficients, shape (n+1,)*dim, of the polynomial
+    with coefficients coeff and monomial structure struct on box (dim X [min, max]),
+    n being the largest exponent.
+    """
+    from scipy.special import comb
+    box = np.array(box, dtype=np.float64)
+    dim = len(box)
+    S = np.array(struct).reshape((-1, dim))
+    n = int(S.max())
+    C = np.zeros((n+1,)*dim)
+    np.add.at(C, tuple(S.T), coeff)
+    j = np.arange(n+1)
+    BIN = comb(j[:, np.newaxis], j[np.newaxis, :]) # BIN[k, j] = binom(k, j)
+    # power to Bernstein basis on [0, 1]
+    PB = BIN / comb(n, j)[np.newaxis, :]
+    for axis, (a, b) in enumerate(box):
+        # x = a + (b-a) t, i.e. T[k, j] = binom(j, k) a^(j-k) (b-a)^k
+        T = BIN.T * np.power(a, np.clip(j[np.newaxis, :] - j[:, np.newaxis], 0, None)) * np.power(b-a, j)[:, np.newaxis]
+        C = np.moveaxis(np.tensordot(PB.dot(T), C, axes=([1], [axis])), 0, axis)
+    return C
+
+def bernsteinSplit(B, axis):
+    """
+    de Casteljau subdivision of the Bernstein coefficients B at the midpoint of axis.
+    """
+    from scipy.special import comb
+    n = B.shape[axis] - 1
+    k, j = np.arange(n+1)[:, np.newaxis], np.arange(n+1)[np.newaxis, :]
+    L = comb(k, j) / 2.**k
+    R = comb(n-k, j-k) / 2.**(n-k)
+    return [np.moveaxis(np.tensordot(A, B, axes=([1], [axis])), 0, axis) for A in (L, R)]
+
+def polyChangesSignBernstein(coeff, struct, box, maxboxes=64):
+    """
+    Certified check whether the polynomial with coefficients coeff and monomial
+    structure struct changes sign within box (dim X [min, max]).
+    The Bernstein coefficients enclose the range of the polynomial --- a box where they
+    all have the same sign is free of sign changes, while the corner coefficients are
+    values of the polynomial and provide witness points. Undecided boxes are bisected.
+    Returns True/False, or None if undecided after maxboxes boxes, and the corner
+    points with the smallest and largest value seen.
+    """
+    box = np.array(box, dtype=np.float64)
+    dim = len(box)
+    corners = tuple([0, -1] for _ in range(dim))
+    qmin, qmax, xmin, xmax = np.inf, -np.inf, None, None
+    todo = [(bernsteinCoefficients(coeff, struct, box), box)]
+    nboxes = 0
+    while todo:
+        B, bx = todo.pop()
+        nboxes += 1
+        V = B[np.ix_(*corners)]
+        imin, imax = np.unravel_index(np.argmin(V), V.shape), np.unravel_index(np.argmax(V), V.shape)
+        if V[imin] < qmin: qmin, xmin = V[imin], bx[np.arange(dim), imin]
+        if V[imax] > qmax: qmax, xmax = V[imax], bx[np.arange(dim), imax]
+        if qmin < 0 < qmax: return True, xmin, xmax
+        if B.min() > 0 or B.max() < 0: continue
+        if nboxes + len(todo) >= maxboxes: return None, xmin, xmax
+        axis = np.argmax(bx[:, 1] - bx[:, 0])
+        mid = 0.5*(bx[axis, 0] + bx[axis, 1])
+        left, right = bx.copy(), bx.copy()
+        left[axis, 1], right[axis, 0] = mid, mid
+        BL, BR = bernsteinSplit(B, axis)
+        todo.extend([(BL, left), (BR, right)])
+    return False, xmin, xmax
+
+def denomChangesSignBernstein(rapp, multistart=10, maxboxes=64, maxsize=2**22):
+    """
+    Certified check whether the denominator of rapp changes sign in the scaled box,
+    c.f. polyChangesSignBernstein. If that is undecided, or for approximations
+    without monomial structure or with a coefficient tensor exceeding maxsize,
+    denomChangesSignMS decides. Returns the same as denomChangesSignMS.
+    """
+    if not hasattr(rapp, "_struct_q"): return denomChangesSignMS(rapp, multistart)
+    box = rapp._scaler.box_scaled
+    if (np.max(rapp._struct_q)+1)**len(box) > maxsize: return denomChangesSignMS(rapp, multistart)
+    bad, xmin, xmax = polyChangesSignBernstein(rapp._qcoeff, rapp._struct_q, box, maxboxes)
+    if bad is None: return denomChangesSignMS(rapp, multistart)
+    return bad, xmin, xmax
 
-def calcApprox(X, Y, order, pnames, mode= "sip", onbtol=-1, debug=False, testforPoles=100, ftol=1e-9, itslsqp=200):
+
+def calcApprox(X, Y, order, pnames, mode= "sip", onbtol=-1, debug=False, testforPoles=100, ftol=1e-9, itslsqp=200, coeffs0=None):
+    """
+    coeffs0 --- optional warm start (pcoeff, qcoeff concatenated) for the SLSQP fits,
+                in lasip mode the LA solution is used if not given
+    """
     M, N = order
     import apprentice as app
     if N==0:
@@ -71,29 +157,84 @@ def calcApprox(X, Y, order, pnames, mode= "sip", onbtol=-1, debug=False, testfor
         elif mode == "onb": _app = app.RationalApproximationONB(X, Y, order=(M,N), pnames=pnames, tol=onbtol, debug=debug)
         elif mode == "sip":
             try:
-                _app = app.RationalApproximationSLSQP(X, Y, order=(M,N), pnames=pnames, debug=debug, ftol=ftol, itslsqp=itslsqp)
+                _app = app.RationalApproximationSLSQP(X, Y, order=(M,N), pnames=pnames, debug=debug, ftol=ftol, itslsqp=itslsqp, coeffs0=coeffs0)
             except Exception as e:
                 print("Exception:", e)
                 return None, True
         elif mode == "lasip":
             try:
-                _app = app.RationalApproximation(X, Y, order=(M,N), pnames=pnames, strategy=2, debug=debug)
+                _app = app.RationalApproximation(X, Y, order=(M,N), pnames=pnames, strategy=2)
             except Exception as e:
                 print("Exception:", e)
                 return None, True
-            has_pole = denomChangesSignMS(_app, 100)[0]
+            has_pole = denomChangesSignBernstein(_app, 100)[0]
             if has_pole:
+                if coeffs0 is None: coeffs0 = np.concatenate((_app._pcoeff, _app._qcoeff))
                 try:
-                    _app = app.RationalApproximationSLSQP(X, Y, order=(M,N), pnames=pnames, debug=debug, ftol=ftol, itslsqp=itslsqp)
+                    _app = app.RationalApproximationSLSQP(X, Y, order=(M,N), pnames=pnames, debug=debug, ftol=ftol, itslsqp=itslsqp, coeffs0=coeffs0)
                 except Exception as e:
                     print("Exception:", e)
                     return None, True
         else:
             raise Exception("Specified mode {} does not exist, choose la|onb|sip".format(mode))
-        hasPole = denomChangesSignMS(_app, testforPoles)[0]
+        hasPole = denomChangesSignBernstein(_app, testforPoles)[0]
 
     return _app, hasPole
 
+def calcApproxMany(todo, order, pnames, mode="sip", warm=True, **kwargs):
+    """
+    Fit the bins in todo, a list of (binid, X, Y, xmin, xmax), one after the other --- the
+    SLSQP fit of a bin is warm started from the previous bin of the same histogram unless
+    warm is False. Yields (approximation dict or None, hasPole, fit time) per bin.
+    """
+    import time
+    last = (None, None)
+    for binid, X, Y, xmin, xmax in todo:
+        hname = binid.split("#")[0]
+        t0 = time.time()
+        temp, hasPole = calcApprox(X, Y, order, pnames, mode, coeffs0=last[1] if warm and last[0] == hname else None, **kwargs)
+        if temp is None:
+            yield None, hasPole, time.time() - t0
+            continue
+        if hasattr(temp, "_qcoeff"): last = (hname, np.concatenate((temp._pcoeff, temp._qcoeff)))
+        temp._vmin = np.min(Y)
+        temp._vmax = np.max(Y)
+        temp._xmin = xmin
+        temp._xmax = xmax
+        yield temp.asDict, hasPole, time.time() - t0
+
+def calcApproxChunk(*args, **kwargs):
+    return list(calcApproxMany(*args, **kwargs))
+
+def chunksByCost(binids, chunksize, times=None):
+    """
+    Chunks of chunksize consecutive positions in binids, the most expensive
+    chunks first if the costs are known (times, binid -> seconds) --- bins
+    without known cost count with the median cost.
+    """
+    chunks = [list(range(i, min(i+chunksize, len(binids)))) for i in range(0, len(binids), chunksize)]
+    if times:
+        default = np.median(list(times.values()))
+        chunks.sort(key=lambda c: -sum([times.get(binids[i], default) for i in c]))
+    return chunks
+
+def calcApproxPool(todo, order, pnames, mode="sip", jobs=2, times=None, chunksize=4, warm=True, **kwargs):
+    """
+    Fit the bins in todo, a list of (binid, X, Y, xmin, xmax), in a pool of jobs processes.
+    Chunks of chunksize consecutive bins are handed out from a shared queue to
+    whichever process is idle, the most expensive chunks first if the fit times of
+    a previous run are known (times, binid -> seconds).
+    Yields (position in todo, approximation dict or None, hasPole, fit time)
+    in the order the chunks complete.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    chunks = chunksByCost([t[0] for t in todo], chunksize, times)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = dict([(pool.submit(calcApproxChunk, [todo[i] for i in c], order, pnames, mode, warm, **kwargs), c) for c in chunks])
+        for future in as_completed(futures):
+            for i, res in zip(futures[future], future.result()):
+                yield (i,) + tuple(res)
+
 def extreme(app, nsamples=1, nrestart=1, use_grad=False, mode="min"):
     PF = 1 if mode=="min" else -1
     if use_grad: jac=lambda x:PF*app.gradient(x)
@@ -341,6 +482,25 @@ def gradientRecursionFast(X, struct, jacfac, NNZ, sred):
 
     return REC
 
+def gradientRecursionMany(X, struct, jacfac):
+    """
+    X ... scaled points, shape (npoints, dim)
+    struct ... polynomial structure, i.e. monomialStructure(dim, order)
+    jacfac ... jacobian factor
+    returns array of shape (dim, len(struct), npoints), i.e. gradientRecursion
+    for every point in X stacked along the last axis. The derivatives are read
+    off the parent product recurrence, c.f. monomial.monomialDerivatives.
+    """
+    from apprentice import monomial
+    S = struct.reshape((len(struct), -1))
+    dim = S.shape[1]
+    X = np.reshape(X, (-1, dim))
+    order = int(S.sum(axis=1).max())
+    parent, coord = monomial.monomialParents(dim, order)
+    lower, factor = monomial.monomialDerivatives(dim, order)
+    REC = monomial.recurrenceParentsMany(X, parent, coord)
+    return (np.asarray(jacfac)[:, np.newaxis] * factor)[:, :, np.newaxis] * REC[lower]
+
 def getPolyGradient(coeff, X, dim=2, n=2):
     from apprentice import monomial
     import numpy as np
@@ -372,6 +532,74 @@ def getPolyGradient(coeff, X, dim=2, n=2):
         grad[coord] = np.dot(der, coeff)
     return grad
 
+def getPolyGradientMany(coeff, X, dim=2, n=2):
+    """
+    Gradients, shape (len(X), dim), of the polynomial with coefficients coeff
+    and structure monomialStructure(dim, n) at all points X at once.
+    """
+    from apprentice import monomial
+    X = np.reshape(X, (-1, dim))
+    parent, coord = monomial.monomialParents(dim, n)
+    lower, factor = monomial.monomialDerivatives(dim, n)
+    REC = monomial.recurrenceParentsMany(X, parent, coord)
+    return np.array([(coeff * factor[c]).dot(REC[lower[c]]) for c in range(dim)]).T
+
+def quasiRandomBox(box, nsamples, seed=None):
+    """
+    At least nsamples scrambled Sobol points (the next power of 2) within box (dim X [min, max]),
+    uniform random points if scipy.stats.qmc is not available.
+    """
+    box = np.array(box, dtype=np.float64)
+    try:
+        from scipy.stats import qmc
+        U = qmc.Sobol(d=len(box), scramble=True, seed=seed).random_base2(int(np.ceil(np.log2(nsamples))))
+    except ImportError:
+        U = np.random.RandomState(seed).uniform(size=(nsamples, len(box)))
+    return box[:, 0] + U * (box[:, 1] - box[:, 0])
+
+def polyPolishBox(coeff, dim, n, box, X, maxiter=200):
+    """
+    Minimise the polynomial with coefficients coeff and structure monomialStructure(dim, n)
+    starting from all points X at once by projected gradient descent with per point
+    step sizes, staying within box. Returns the best x, f(x).
+    """
+    from apprentice import monomial
+    box = np.array(box, dtype=np.float64)
+    lo, hi = box[:, 0], box[:, 1]
+    parent, coord = monomial.monomialParents(dim, n)
+    X = np.array(X, dtype=np.float64)
+    F = coeff.dot(monomial.recurrenceParentsMany(X, parent, coord))
+    step = np.full(len(X), 0.1 * np.max(hi - lo))
+    for _ in range(maxiter):
+        G = getPolyGradientMany(coeff, X, dim, n)
+        XN = np.clip(X - step[:, np.newaxis] * G, lo, hi)
+        FN = coeff.dot(monomial.recurrenceParentsMany(XN, parent, coord))
+        better = FN < F
+        X[better], F[better] = XN[better], FN[better]
+        step = np.where(better, 2 * step, 0.5 * step)
+        if np.all(step < 1e-10): break
+    i = np.argmin(F)
+    return X[i], F[i]
+
+def polyMinBox(coeff, dim, n, box, nsamples=1024, npolish=4, maxiter=200, seed=0):
+    """
+    Approximate global minimum of the polynomial with coefficients coeff and structure
+    monomialStructure(dim, n) within box (dim X [min, max]).
+    The polynomial is evaluated at nsamples quasi-random points (plus the corners of
+    the box if there are at most nsamples of them) in one matrix product,
+    the npolish best points are then polished together, c.f. polyPolishBox.
+    Returns x, f(x).
+    """
+    from apprentice import monomial
+    X = quasiRandomBox(box, nsamples, seed)
+    if 2**dim <= nsamples:
+        # Extrema of polynomials like to sit in the corners of the box
+        import itertools
+        X = np.vstack((X, np.array([b for b in itertools.product(*box)], dtype=np.float64)))
+    parent, coord = monomial.monomialParents(dim, n)
+    F = coeff.dot(monomial.recurrenceParentsMany(X, parent, coord))
+    return polyPolishBox(coeff, dim, n, box, X[np.argsort(F)[:npolish]], maxiter)
+
 
 def possibleOrders(N, dim, mirror=False):
     """
@@ -417,14 +645,86 @@ def chunkIt(seq, num):
 
     return out
 
+def taskFarm(comm, tasks, work, order=None):
+    """
+    Dynamic master/worker scheduling over the ranks of comm. Rank 0 hands out
+    the tasks (only needed on rank 0, in the given order of positions if any) one
+    at a time to whichever rank asks for more, the other ranks call work(task) and
+    send the result back straight away. Yields (position of task, result) on rank 0
+    in the order of completion, nothing on the other ranks.
+    Without comm or with a single rank, rank 0 does all the work itself.
+    """
+    if comm is None or comm.Get_size() == 1:
+        for i in (range(len(tasks)) if order is None else order):
+            yield i, work(tasks[i])
+        return
+
+    from mpi4py import MPI
+    if comm.Get_rank() == 0:
+        todo = iter(range(len(tasks)) if order is None else order)
+        status = MPI.Status()
+        nactive = comm.Get_size() - 1
+        while nactive > 0:
+            # A worker asking for its first task sends None, later ones their last result
+            res = comm.recv(source=MPI.ANY_SOURCE, status=status)
+            i = next(todo, None)
+            comm.send(None if i is None else (i, tasks[i]), dest=status.Get_source())
+            if i is None: nactive -= 1
+            if res is not None: yield res
+    else:
+        res = None
+        while True:
+            comm.send(res, dest=0)
+            job = comm.recv(source=0)
+            if job is None: break
+            res = (job[0], work(job[1]))
+
+class SerialComm(object):
+    """
+    Stand-in for MPI.COMM_WORLD with a single rank, for running without mpi4py.
+    Only the collectives used by apprentice.io are provided.
+    """
+    def Get_rank(self): return 0
+    def Get_size(self): return 1
+    def bcast(self, obj, root=0): return obj
+    def scatter(self, objs, root=0): return objs[0]
+    def gather(self, obj, root=0): return [obj]
+    def barrier(self): pass
+
+def worldComm():
+    """
+    MPI.COMM_WORLD if mpi4py is available, else a SerialComm.
+    """
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        return SerialComm()
+    return MPI.COMM_WORLD
+
 def mkCov(yerrs):
     import numpy as np
     return np.atleast_2d(yerrs).T * np.atleast_2d(yerrs) * np.eye(yerrs.shape[0])
 
+def binEdges(AS, fname):
+    """
+    Bin edges of the bins of AppSet AS read from fname. HDF5 containers store them
+    per bin (c.f. app.io.readApproxH5), JSON files may have them in __xmin and __xmax only.
+    """
+    xmin, xmax = AS._xmin, AS._xmax
+    if np.any(np.isnan(xmin)) or np.any(np.isnan(xmax)):
+        import h5py
+        if h5py.is_hdf5(fname): raise Exception("No bin edges stored in {}".format(fname))
+        import apprentice as app
+        edges = app.io.approxEdges(app.io.readApproxDict(fname))
+        xmin = np.array([edges[b][0] for b in AS._binids], dtype=np.float64)
+        xmax = np.array([edges[b][1] for b in AS._binids], dtype=np.float64)
+    return xmin, xmax
+
 def prediction2YODA(fvals, Peval, fout="predictions.yoda", ferrs=None, wfile=None):
     import apprentice as app
-    vals = app.AppSet(fvals)
-    errs = app.AppSet(ferrs) if ferrs is not None else None
+    wobs = list(set(app.io.readObs(wfile))) if wfile is not None else None
+    vals = app.AppSet(fvals, observables=wobs)
+    errs = app.AppSet(ferrs, observables=wobs) if ferrs is not None else None
 
     P = [Peval[x] for x in vals._SCLR.pnames] if type(Peval)==dict else Peval
 
@@ -435,11 +735,7 @@ def prediction2YODA(fvals, Peval, fout="predictions.yoda", ferrs=None, wfile=Non
     hnames = sorted(set(hids))
     observables = sorted([x for x in set(app.io.readObs(wfile)) if x in hnames]) if wfile is not None else hnames
 
-    with open(fvals) as f:
-        import json
-        rd = json.load(f)
-        xmin = np.array(rd["__xmin"])
-        xmax = np.array(rd["__xmax"])
+    xmin, xmax = binEdges(vals, fvals)
 
     DX = (xmax-xmin)*0.5
     X  = xmin + DX
@@ -453,20 +749,17 @@ def prediction2YODA(fvals, Peval, fout="predictions.yoda", ferrs=None, wfile=Non
 
 def envelope2YODA(fvals, fout_up="envelope_up.yoda", fout_dn="envelope_dn.yoda", wfile=None):
     import apprentice as app
-    vals = app.AppSet(fvals)
+    wobs = list(set(app.io.readObs(wfile))) if wfile is not None else None
+    vals = app.AppSet(fvals, observables=wobs)
 
-    Yup = np.array([r.vmax for r in vals._RA])
-    Ydn = np.array([r.vmin for r in vals._RA])
+    Yup = vals._vmax
+    Ydn = vals._vmin
     dY = np.zeros_like(Yup)
     hids=np.array([b.split("#")[0] for b in vals._binids])
     hnames = sorted(set(hids))
     observables = sorted([x for x in set(app.io.readObs(wfile)) if x in hnames]) if wfile is not None else hnames
 
-    with open(fvals) as f:
-        import json
-        rd = json.load(f)
-        xmin = np.array(rd["__xmin"])
-        xmax = np.array(rd["__xmax"])
+    xmin, xmax = binEdges(vals, fvals)
 
     DX = (xmax-xmin)*0.5
     X  = xmin + DX
@@ -519,7 +812,8 @@ class TuningObjective(object):
         cache_recursions = kwargs["cache_recursions"] if kwargs.get("cache_recursions") is not None else True
         import apprentice
         import numpy as np
-        binids, RA = apprentice.io.readApprox(f_approx, set_structures=False)
+        rd = apprentice.io.readApproxDict(f_approx)
+        binids = apprentice.io.sortBinids([b for b in rd.keys() if not b.startswith("__")])
         hnames = [b.split("#")[0] for b in binids]
         bnums = [int(b.split("#")[1]) for b in binids]
 
@@ -531,11 +825,15 @@ class TuningObjective(object):
         Y = np.array([dd[b][0] for b in binids])
         E = np.array([dd[b][1] for b in binids])
 
+        # Only construct the approximations of bins that can survive the filtering
+        RA = {num: apprentice.io.mkApprox(rd[binids[num]], set_structures=False) for num in range(len(binids)) if num==0 or (weights[num] > 0 and E[num] > 0)}
+        del rd
+
         # Filter for wanted bins here and get rid of division by zero in case of 0 error which is undefined behaviour
         good = []
         for num, bid in enumerate(binids):
             if weights[num] > 0 and E[num] > 0:
-                if cache_recursions and RA[0]._scaler != RA[num]._scaler:
+                if cache_recursions and RA[0]._scaler is not RA[num]._scaler: # interned at load time
                     if self._debug: print("Warning, dropping bin with id {} to guarantee caching works".format(bid))
                     continue
                 good.append(num)
@@ -650,15 +948,12 @@ class TuningObjective(object):
         # Gradient helpers
         self._NNZ  = [np.where(self._structure[:, coord] != 0) for coord in range(self.dim)]
         self._sred = np.array([self._structure[nz][:,num] for num, nz in enumerate(self._NNZ)])
-        if self.dim == 1:
-            self.recurrence = apprentice.monomial.recurrence1D
-        else:
-            self.recurrence = apprentice.monomial.recurrence
+        self._parent, self._coord = apprentice.monomial.monomialParents(self.dim, omax)
 
     def setCache(self, x):
         import apprentice
-        xs = self._SCLR.scale(x)
-        self._maxrec = self.recurrence(xs, self._structure)
+        xs = self._SCLR.scale(np.atleast_1d(x))
+        self._maxrec = apprentice.monomial.recurrenceParents(xs, self._parent, self._coord)
 
     def scalersIdentical(self):
         """
@@ -666,7 +961,7 @@ class TuningObjective(object):
         """
         s = self._RA[0]._scaler
         for r in self._RA[1:]:
-            if s != r._scaler:
+            if s is not r._scaler and s != r._scaler:
                 return False
         return True
 
@@ -29,50 +29,35 @@ if __name__ == "__main__":
     opts, args = op.parse_args()
 
     np.random.seed(opts.SEED)
-    binids, RA = app.tools.readApprox(args[0], set_structures = True)
+    binids, RA = app.io.readApprox(args[0], set_structures = True)
 
-    rankWork = app.tools.chunkIt([i for i in range(len(binids))], size) if rank==0 else []
-    rankWork = comm.scatter(rankWork, root=0)
     import time
     import sys
     import datetime
     t0=time.time()
 
+    # Rank 0 hands out the bins one at a time to whichever rank is free
+    def work(i):
+        return RA[i].fmin(opts.NTRIALS, opts.NRESTART, use_grad=True), RA[i].fmax(opts.NTRIALS, opts.NRESTART, use_grad=True)
 
-    FMIN, FMAX = [], []
-    for i in rankWork:
-        FMIN.append((binids[i], RA[i].fmin(opts.NTRIALS, opts.NRESTART, use_grad=True)))
-        FMAX.append((binids[i], RA[i].fmax(opts.NTRIALS, opts.NRESTART, use_grad=True)))
+    for num, (i, (fmin, fmax)) in enumerate(app.tools.taskFarm(comm, list(range(len(binids))), work)):
+        RA[i]._vmin=fmin
+        RA[i]._vmax=fmax
 
-        if rank==0:
-            now = time.time()
-            tel = now - t0
-            ttg = tel*(len(rankWork)-i)/(i+1)
-            eta = now + ttg
-            eta = datetime.datetime.fromtimestamp(now + ttg)
-            sys.stdout.write("[{}] {}/{} (elapsed: {:.1f}s, to go: {:.1f}s, ETA: {})\r".format(rank, i+1, len(rankWork), tel, ttg, eta.strftime('%Y-%m-%d %H:%M:%S')))
-            sys.stdout.flush()
+        now = time.time()
+        tel = now - t0
+        ttg = tel*(len(binids)-num-1)/(num+1)
+        eta = now + ttg
+        eta = datetime.datetime.fromtimestamp(now + ttg)
+        sys.stdout.write("[{}] {}/{} (elapsed: {:.1f}s, to go: {:.1f}s, ETA: {})\r".format(rank, num+1, len(binids), tel, ttg, eta.strftime('%Y-%m-%d %H:%M:%S')))
         sys.stdout.flush()
 
     if rank==0:
         print()
 
-    # FMIN = [(binids[i], RA[i].fmin(opts.NTRIALS, use_grad=opts.USEGRAD)) for i in rankWork]
-    # FMAX = [(binids[i], RA[i].fmax(opts.NTRIALS, use_grad=opts.USEGRAD)) for i in rankWork]
     t1=time.time()
 
-    _FMIN = comm.gather(FMIN, root=0)
-    _FMAX = comm.gather(FMAX, root=0)
     if rank==0:
-        _FMIN = [ x for sublist in _FMIN for x in sublist]
-        _FMAX = [ x for sublist in _FMAX for x in sublist]
-        for k, v in _FMIN:
-            i = binids.index(k)
-            RA[i]._vmin=v
-        for k, v in _FMAX:
-            i = binids.index(k)
-            RA[i]._vmax=v
-
         import json
         with open(args[0]) as f:
             rd = json.load(f)
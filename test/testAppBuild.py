@@ -0,0 +1,123 @@
+import apprentice as app
+import numpy as np
+import json, os, subprocess, sys
+
+APPBUILD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin", "app-build")
+
+def mkInput(fname, nruns=40, nhist=2, nbins=3, seed=1):
+    """
+    HDF5 input with nhist histograms of nbins bins, bin i spans [i, i+1].
+    """
+    import h5py
+    rs = np.random.RandomState(seed)
+    P = rs.rand(nruns, 3)
+    data, binids = [], []
+    for h in range(nhist):
+        for b in range(nbins):
+            Y = (1 + P[:,0]*(b+1) + h*P[:,2])/(1.5 + P[:,1])
+            data.append((P, Y, 0.1*np.abs(Y)))
+            binids.append("/T/h{}#{}".format(h, b))
+    edges = np.arange(float(len(binids)))
+    app.io.writeInputDataSetH5(fname, data, np.array(["r{}".format(i) for i in range(nruns)]), np.array(binids), ["a", "b", "c"], edges, edges+1)
+    with h5py.File(fname, "a") as f: f["params"].attrs["names"] = np.char.encode(["a", "b", "c"], encoding="utf8")
+    return binids, edges, edges+1
+
+def runBuild(*args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(APPBUILD), "..") + os.pathsep + env.get("PYTHONPATH", "")
+    subprocess.run([sys.executable, APPBUILD] + [str(a) for a in args], check=True, env=env, stdout=subprocess.DEVNULL)
+
+def test_calcApproxManyEdges():
+    rs = np.random.RandomState(2)
+    X = rs.rand(30, 2)
+    Y = 1 + X[:,0] + X[:,1]**2
+    (d, hasPole, dt), = app.tools.calcApproxMany([("/T/h#0", X, Y, 3., 4.)], (2,0), ["a", "b"], "la")
+    assert d["xmin"] == 3. and d["xmax"] == 4.
+
+def test_polyEdges(tmp_path):
+    binids, xmin, xmax = mkInput(tmp_path / "in.h5")
+    runBuild(tmp_path / "in.h5", "--order", "2,0", "-o", tmp_path / "out.json")
+    with open(tmp_path / "out.json") as f: rd = json.load(f)
+    for num, b in enumerate(binids):
+        assert rd[b]["xmin"] == xmin[num] and rd[b]["xmax"] == xmax[num]
+    assert rd["__xmin"] == list(xmin) and rd["__xmax"] == list(xmax)
+
+def test_h5Edges(tmp_path):
+    binids, xmin, xmax = mkInput(tmp_path / "in.h5")
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "out.h5")
+    AS = app.AppSet(str(tmp_path / "out.h5"))
+    order = [binids.index(b) for b in AS._binids]
+    assert np.all(AS._xmin == xmin[order]) and np.all(AS._xmax == xmax[order])
+    lo, hi = app.tools.binEdges(AS, str(tmp_path / "out.h5"))
+    assert np.all(lo == xmin[order]) and np.all(hi == xmax[order])
+
+def test_shardEdges(tmp_path):
+    binids, xmin, xmax = mkInput(tmp_path / "in.h5")
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "out.json")
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "shards", "--shards")
+    app.io.mergeApproxShards(str(tmp_path / "shards"), str(tmp_path / "merged.json"))
+    with open(tmp_path / "out.json") as f: ref = json.load(f)
+    with open(tmp_path / "merged.json") as f: rd = json.load(f)
+    assert rd == ref
+    for fname in ["shards", "merged.json"]:
+        AS = app.AppSet(str(tmp_path / fname))
+        order = [binids.index(b) for b in AS._binids]
+        assert np.all(AS._xmin == xmin[order]) and np.all(AS._xmax == xmax[order])
+
+def test_h5MixedScaler(tmp_path):
+    import h5py
+    binids, xmin, xmax = mkInput(tmp_path / "in.h5")
+    with h5py.File(tmp_path / "in.h5", "a") as f:
+        P = f["params"][()]
+        # Dropping the run with the largest first parameter changes the scaler of bin 0
+        V = f["values"][()]
+        V[0, np.argmax(P[:,0])] = np.nan
+        f["values"][...] = V
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "out.json")
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "out.h5")
+    ref = app.AppSet(str(tmp_path / "out.json"))
+    assert not np.all(ref.sameScaler())
+    AS = app.AppSet(str(tmp_path / "out.h5"))
+    assert list(AS._binids) == list(ref._binids) and np.all(AS.sameScaler())
+    _, RA = app.io.readApprox(str(tmp_path / "out.json"), usethese=AS._binids)
+    X = np.random.RandomState(3).rand(20, 3)
+    for num, r in enumerate(RA):
+        assert np.allclose([AS.vals(x)[num] for x in X], [r(x) for x in X])
+
+def test_resumePoly(tmp_path):
+    binids, xmin, xmax = mkInput(tmp_path / "in.h5")
+    runBuild(tmp_path / "in.h5", "--order", "2,0", "-o", tmp_path / "ref.json")
+    runBuild(tmp_path / "in.h5", "--order", "2,0", "-o", tmp_path / "out.json", "--checkpoint", tmp_path / "ckpt")
+    with open(tmp_path / "ckpt" / "approx_0.ckpt") as f: lines = f.readlines()
+    with open(tmp_path / "ckpt" / "approx_0.ckpt", "w") as f: f.writelines(lines[:2])
+    # Only the bins missing from the checkpoint are fitted again
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(APPBUILD), "..") + os.pathsep + env.get("PYTHONPATH", "")
+    code = "\n".join(["import apprentice as app, runpy, sys",
+        "batchFit = app.polynomialapproximation.batchFit",
+        "def check(DATA, *args, **kwargs):",
+        "    assert len(DATA) == {}".format(len(binids) - 2),
+        "    return batchFit(DATA, *args, **kwargs)",
+        "app.polynomialapproximation.batchFit = check",
+        "sys.argv = {!r}".format([APPBUILD, str(tmp_path / "in.h5"), "--order", "2,0", "-o", str(tmp_path / "out.json"), "--checkpoint", str(tmp_path / "ckpt"), "--resume"]),
+        "runpy.run_path({!r}, run_name='__main__')".format(APPBUILD)])
+    subprocess.run([sys.executable, "-c", code], check=True, env=env, stdout=subprocess.DEVNULL)
+    with open(tmp_path / "ref.json") as f: ref = json.load(f)
+    with open(tmp_path / "out.json") as f: rd = json.load(f)
+    assert sorted(rd.keys()) == sorted(ref.keys())
+    for b in binids:
+        assert np.allclose(rd[b].pop("pcoeff"), ref[b].pop("pcoeff")) and rd[b] == ref[b]
+
+def test_noEdges(tmp_path):
+    import h5py
+    binids, xmin, xmax = mkInput(tmp_path / "in.h5")
+    with h5py.File(tmp_path / "in.h5", "a") as f:
+        del f["xmin"], f["xmax"]
+    DATA, _binids, pnames, rankIdx, _xmin, _xmax = app.io.readInputDataH5(str(tmp_path / "in.h5"))
+    assert list(_binids) == binids and np.all(np.isnan(_xmin)) and np.all(np.isnan(_xmax))
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "out.json")
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "out.h5")
+    for fname in ["out.json", "out.h5"]:
+        AS = app.AppSet(str(tmp_path / fname))
+        assert sorted(AS._binids) == sorted(binids)
+        assert np.all(np.isnan(AS._xmin)) and np.all(np.isnan(AS._xmax))
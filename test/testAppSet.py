@@ -0,0 +1,25 @@
+import apprentice as app
+import numpy as np
+
+def mkAppSet():
+    rs = np.random.RandomState(0)
+    X = rs.rand(60, 3)
+    RA = [app.RationalApproximation(X, 1 + X[:,0]**2 + b*X[:,1], order=(2,1), strategy=2) for b in range(3)]
+    RA.append(app.PolynomialApproximation(X, X[:,2]**3 - X[:,0], order=3))
+    return app.AppSet(RA, ["/T/h#{}".format(i) for i in range(len(RA))])
+
+def test_gradientRecursionMany():
+    rs = np.random.RandomState(1)
+    for dim, order in [(1, 3), (2, 2), (3, 4)]:
+        S = np.array(app.monomialStructure(dim, order))
+        X, jacfac = rs.uniform(-1, 1, (7, dim)), rs.rand(dim) + 0.5
+        ref = np.stack([app.tools.gradientRecursion(x, S.reshape((len(S), dim)), jacfac) for x in X], axis=-1)
+        assert np.allclose(app.tools.gradientRecursionMany(X, S, jacfac), ref)
+        coeff = rs.rand(len(S))
+        assert np.allclose(app.tools.getPolyGradientMany(coeff, X, dim, order), [app.tools.getPolyGradient(coeff, x, dim, order) for x in X])
+
+def test_gradsMany():
+    AS = mkAppSet()
+    P = np.random.RandomState(2).rand(5, 3)
+    assert np.allclose(AS.grads_many(P), [AS.grads(p) for p in P])
+    assert np.allclose(AS.vals_many(P), [AS.vals(p) for p in P])
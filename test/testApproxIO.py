@@ -0,0 +1,54 @@
+import apprentice as app
+import numpy as np
+import json, os
+
+def mkApproxs(nhist=3, nbins=4):
+    """
+    Rational and polynomial approximations of nhist histograms of nbins bins,
+    binids /T/h<h>#<b> and bin edges [b, b+1].
+    """
+    rs = np.random.RandomState(0)
+    X = rs.rand(50, 2)
+    binids, RA = [], []
+    for h in range(nhist):
+        for b in range(nbins):
+            Y = (1 + X[:,0]*(b+1) + h*X[:,1])/(1.5 + X[:,1])
+            r = app.RationalApproximation(X, Y, order=(2,1), strategy=2) if h % 2 == 0 else app.PolynomialApproximation(X, Y, order=2)
+            r._xmin, r._xmax = float(b), float(b+1)
+            binids.append("/T/h{}#{}".format(h, b))
+            RA.append(r)
+    return binids, RA
+
+def test_shardMerge(tmp_path):
+    binids, RA = mkApproxs()
+    os.makedirs(tmp_path / "shards")
+    # Two ranks, bins interleaved, rationals carry their edges only in the shard lines
+    for rank in range(2):
+        with open(tmp_path / "shards" / "approx_{}.jsonl".format(rank), "w") as f:
+            for b, r in list(zip(binids, RA))[rank::2]:
+                f.write(json.dumps([b, r.asDict, [r._xmin, r._xmax]]) + "\n")
+    ref = app.AppSet(RA, binids)
+    P = np.random.RandomState(1).rand(5, 2)
+    for fout in ["shards", "merged.json", "merged.h5"]:
+        if fout != "shards": app.io.mergeApproxShards(str(tmp_path / "shards"), str(tmp_path / fout))
+        AS = app.AppSet(str(tmp_path / fout))
+        assert list(AS._binids) == binids
+        assert np.all(AS._xmin == np.arange(len(binids)) % 4) and np.all(AS._xmax == AS._xmin + 1)
+        assert np.allclose(AS.vals_many(P), ref.vals_many(P))
+
+def test_jsonRoundTrip(tmp_path):
+    binids, RA = mkApproxs()
+    JD = dict([(b, r.asDict) for b, r in zip(binids, RA)])
+    with open(tmp_path / "approx.json", "w") as f: json.dump(JD, f)
+    ref = app.AppSet(RA, binids)
+    P = np.random.RandomState(2).rand(5, 2)
+    AS = app.AppSet(str(tmp_path / "approx.json"))
+    assert list(AS._binids) == binids and np.all(AS.sameScaler())
+    assert np.allclose(AS.vals_many(P), ref.vals_many(P)) and np.allclose(AS.grads_many(P), ref.grads_many(P))
+    for name in ["m", "n", "vmin", "vmax"]:
+        assert np.array_equal(getattr(AS, "_"+name), getattr(ref, "_"+name), equal_nan=True)
+    # Only the requested observables are loaded
+    AS = app.AppSet(str(tmp_path / "approx.json"), observables=["/T/h1"])
+    keep = [num for num, b in enumerate(binids) if b.startswith("/T/h1#")]
+    assert list(AS._binids) == [binids[k] for k in keep]
+    assert np.allclose(AS.vals_many(P), ref.vals_many(P)[:, keep])
@@ -0,0 +1,39 @@
+import apprentice as app
+import numpy as np
+import h5py, os
+import pytest
+
+def mkRuns(tmp_path, nruns=7):
+    """
+    Run directories in tmp_path/runs and a read_rundata replacement returning
+    their (params, histos) --- histogram /T/b is missing in run 3.
+    """
+    rs = np.random.RandomState(3)
+    os.makedirs(tmp_path / "runs")
+    PARAMS, HISTOS = {}, {}
+    for r in range(nruns):
+        d = str(tmp_path / "runs" / "{:04d}".format(r))
+        os.makedirs(d)
+        PARAMS[d] = {"a": rs.rand(), "b": rs.rand()}
+        for hn, nb in [("/T/a", 3), ("/T/b", 2), ("/T/c", 4)]:
+            if hn == "/T/b" and r == 3: continue
+            HISTOS.setdefault(hn, {})[d] = [(i, i+1, rs.rand(), 0.1) for i in range(nb)]
+    def read_rundata(dirs, pfname="params.dat", verbosity=1, jobs=1):
+        return dict([(d, PARAMS[d]) for d in dirs]), dict([(hn, dict([(d, H[d]) for d in sorted(dirs) if d in H])) for hn, H in HISTOS.items()])
+    return read_rundata
+
+def test_sameContainer(tmp_path, monkeypatch):
+    pytest.importorskip("yoda")
+    monkeypatch.setattr(app.io, "read_rundata", mkRuns(tmp_path))
+    with open(tmp_path / "weights", "w") as f: f.write("/T/a 1\n/T/b 1\n")
+    DATA, binids, pnames, rankIdx, xmin, xmax = app.io.readInputDataYODA([str(tmp_path / "runs")], wfile=str(tmp_path / "weights"), storeAsH5=str(tmp_path / "all.h5"))
+    app.io.writeInputDataYODAH5([str(tmp_path / "runs")], str(tmp_path / "batch.h5"), wfile=str(tmp_path / "weights"), batchsize=2)
+    with h5py.File(tmp_path / "all.h5", "r") as f, h5py.File(tmp_path / "batch.h5", "r") as g:
+        assert sorted(f.keys()) == sorted(g.keys())
+        assert list(np.char.decode(f["index"][()], encoding="utf8")) == ["/T/a#0", "/T/a#1", "/T/a#2", "/T/b#0", "/T/b#1"]
+        for name in f.keys():
+            assert np.array_equal(f[name][()], g[name][()], equal_nan=f[name].dtype.kind == "f")
+        assert np.array_equal(f["params"].attrs["names"], g["params"].attrs["names"])
+    assert app.io.readPnamesH5(str(tmp_path / "all.h5"), xfield="params") == ["a", "b"]
+    for (X, Y, E), (_X, _Y, _E) in zip(DATA, app.io.readH5(str(tmp_path / "batch.h5"), rankIdx)):
+        assert np.array_equal(X, _X) and np.array_equal(Y, _Y) and np.array_equal(E, _E)
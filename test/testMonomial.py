@@ -0,0 +1,15 @@
+import apprentice as app
+import numpy as np
+
+def test_recurrenceParents():
+    rs = np.random.RandomState(0)
+    for dim, order in [(1, 5), (2, 3), (4, 3), (6, 2)]:
+        S = app.monomialStructure(dim, order)
+        parent, coord = app.monomial.monomialParents(dim, order)
+        assert np.all(parent[1:] < np.arange(1, len(parent)))
+        X = rs.uniform(-1, 1, (5, dim))
+        REF = np.array([app.monomial.recurrence1D(x, S) if dim == 1 else app.monomial.recurrence(x, S) for x in X])
+        for x, ref in zip(X, REF):
+            assert np.allclose(app.monomial.recurrenceParents(x, parent, coord), ref)
+        assert np.allclose(app.monomial.recurrenceParentsMany(X, parent, coord), REF.T)
+        assert np.allclose(app.monomial.designMatrix(X, order), REF)
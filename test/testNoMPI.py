@@ -0,0 +1,55 @@
+import numpy as np
+import json, os, subprocess, sys
+from testAppBuild import APPBUILD, mkInput, runBuild
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def runWithoutMPI(code):
+    """
+    Run code in a fresh interpreter in which mpi4py cannot be imported.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.join(HERE, ".."), HERE, env.get("PYTHONPATH", "")])
+    subprocess.run([sys.executable, "-c", "import sys\nsys.modules['mpi4py'] = None\n" + code], check=True, env=env, stdout=subprocess.DEVNULL)
+
+def test_buildJobs(tmp_path):
+    mkInput(tmp_path / "in.h5")
+    runBuild(tmp_path / "in.h5", "--order", "2,1", "--mode", "la", "-o", tmp_path / "ref.json")
+    runWithoutMPI("import runpy\nsys.argv = {}\nrunpy.run_path({!r}, run_name='__main__')".format(
+        [APPBUILD, str(tmp_path / "in.h5"), "--order", "2,1", "--mode", "la", "-j", "2", "-o", str(tmp_path / "out.json")], APPBUILD))
+    with open(tmp_path / "ref.json") as f: ref = json.load(f)
+    with open(tmp_path / "out.json") as f: rd = json.load(f)
+    assert rd == ref
+
+def test_yodaH5(tmp_path):
+    runWithoutMPI("""
+import apprentice as app
+import pathlib
+from testInputData import mkRuns
+tmp_path = pathlib.Path({!r})
+app.io.read_rundata = mkRuns(tmp_path)
+app.io.writeInputDataYODAH5([str(tmp_path / "runs")], str(tmp_path / "batch.h5"), batchsize=2, jobs=2)
+""".format(str(tmp_path)))
+    import apprentice as app
+    DATA, binids, pnames, rankIdx, xmin, xmax = app.io.readInputDataH5(str(tmp_path / "batch.h5"))
+    assert pnames == ["a", "b"] and len(binids) == 9
+    # /T/b is missing in run 3
+    assert [len(X) for X, Y, E in DATA] == [7, 7, 7, 6, 6, 7, 7, 7, 7]
+
+def test_readRundataJobs(tmp_path):
+    for r in range(5):
+        d = tmp_path / "runs" / "{:04d}".format(r)
+        os.makedirs(d)
+        with open(d / "params.dat", "w") as f: f.write("a {}\nb {}\n".format(r, 2*r))
+        with open(d / "h.yoda", "w") as f: f.write("{}\n".format(0.5*r))
+    # The workers are forked and see the replacement of read_histos
+    runWithoutMPI("""
+import apprentice as app
+import multiprocessing, os
+multiprocessing.set_start_method("fork")
+app.io.read_histos = lambda f: {{"/T/h": [(0, 1, float(open(f).read()), 0.1)]}}
+dirs = [os.path.join({!r}, d) for d in os.listdir({!r})]
+serial = app.io.read_rundata(dirs, jobs=1)
+assert len(serial[0]) == 5 and len(serial[1]["/T/h"]) == 5
+assert app.io.read_rundata(dirs, jobs=2) == serial
+""".format(str(tmp_path / "runs"), str(tmp_path / "runs")))
@@ -0,0 +1,46 @@
+import apprentice as app
+import numpy as np
+import itertools
+
+def mkCornerQ(dim=3, n=3):
+    """
+    Cubic with its minimum in a corner of [-1, 1]^3 that 256 Sobol points miss.
+    """
+    rs = np.random.RandomState(157)
+    qcoeff = rs.normal(size=app.tools.numCoeffsPoly(dim, n))
+    qcoeff[0] += 3
+    return qcoeff
+
+def cornerMin(qcoeff, dim=3, n=3):
+    C = np.array(list(itertools.product(*[[-1., 1.]]*dim)))
+    parent, coord = app.monomial.monomialParents(dim, n)
+    return np.min(qcoeff.dot(app.monomial.recurrenceParentsMany(C, parent, coord)))
+
+def mkFit():
+    rs = np.random.RandomState(0)
+    X = rs.uniform(-1, 1, (200, 3))
+    Y = np.exp(X.sum(axis=1))/(1.2 + X[:,0])
+    return app.RationalApproximationSLSQP(X, Y, order=(3,3))
+
+def test_polyMinBoxCorner():
+    qcoeff = mkCornerQ()
+    box = [[-1., 1.]]*3
+    x, f = app.tools.polyMinBox(qcoeff, 3, 3, box, nsamples=256)
+    assert f <= cornerMin(qcoeff) + 1e-12
+    assert np.all(app.tools.polyMinBox(qcoeff, 3, 3, box, nsamples=256)[0] == x)
+
+def test_batchVsMS(monkeypatch):
+    r = mkFit()
+    assert r._roboptstrategy == "ms"
+    coeffs = np.concatenate((np.zeros(r.M), mkCornerQ()))
+    np.random.seed(1)
+    xms, robOms = r.multipleRestartForIterRobO(coeffs, 50, threshold=-np.inf)[:2]
+    x, robO = r.batchRobO(coeffs, threshold=0.7)[:2]
+    assert robO <= robOms + 1e-6 and robO < 0.7
+
+    # A minimum above threshold missed by the sampling is not accepted
+    centre = np.zeros(3)
+    monkeypatch.setattr(app.tools, "polyMinBox", lambda *args, **kwargs: (centre, r.robustObj(centre, coeffs)))
+    assert r.robustObj(centre, coeffs) >= 0.7
+    x, robO = r.batchRobO(coeffs, threshold=0.7)[:2]
+    assert robO < 0.7 and np.isclose(robO, r.robustObj(x, coeffs))
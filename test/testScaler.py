@@ -0,0 +1,17 @@
+import apprentice as app
+import numpy as np
+import gc
+
+def test_internScaler():
+    X = np.random.RandomState(0).rand(20, 3)
+    d = app.Scaler(X, pnames=["a", "b", "c"]).asDict
+    S = app.scaler.internScaler(d)
+    # Round off from a JSON round trip through another writer and other names
+    e = dict(d, Xmin=list(np.array(d["Xmin"])*(1+1e-14)), pnames=["x", "y", "z"])
+    assert app.scaler.internScaler(e) is S
+    f = dict(d, Xmin=list(np.array(d["Xmin"]) - 0.1))
+    assert app.scaler.internScaler(f) is not S
+    n = len(app.scaler._INTERNED)
+    del S
+    gc.collect()
+    assert len(app.scaler._INTERNED) < n